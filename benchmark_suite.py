@@ -0,0 +1,157 @@
+import os, sys, json, math, random, statistics, time, tracemalloc, argparse, functools
+import scipy.optimize as optimization
+import scipy.stats
+
+# The three assignments are plain scripts in their own folders
+root = os.path.dirname(os.path.abspath(__file__))
+for folder in ('first_assignment', 'second_assignment', 'third_assignment'):
+	sys.path.insert(0, os.path.join(root, folder))
+import first, second, third
+
+# If you want to run the benchmark and store its results, use:
+# $ python3 benchmark_suite.py --output results.json
+# and to compare a later run against them (exit status 1 on regressions):
+# $ python3 benchmark_suite.py --baseline results.json
+
+#------------------- RANDOM INSTANCES --------------------
+
+def packing_instance(n, generator):
+  # Same instances of second.benchmarking_routine, drawn from the given
+  # random.Random generator
+	C = n**(1/2)
+	weights = [generator.uniform(0,1) for i in range(n)]
+	while sum(weights) <= C:
+		weights = [generator.uniform(0,1) for i in range(n)]
+	return (n, weights, C)
+
+def recurrent_pattern_instance(n, generator):
+  # A random genome of n nucleotides, searched for patterns of
+  # length 5 within Hamming distance 1
+	genome = ''.join(generator.choice(third.genomic_alphabet) for i in range(n))
+	return (5, genome, 1, third.genomic_alphabet)
+
+def linear(n, a, b):
+  # With the pattern length fixed, the brute force of the third
+  # assignment compares each of the 4^m patterns with every k-mer, so
+  # its time grows linearly with the genome length n
+	return a*n+b
+
+def n_log_n(n, a, b):
+  # first_fit keeps the free space of the open bins in a tree and finds
+  # the first bin an item fits in with a logarithmic descent, so its
+  # time grows as n*log(n) instead of the quadratic scan of the
+  # original code
+	return a*n*math.log(n)+b
+
+# For every benchmarked function: the function, the instance generator,
+# the sizes of the sweep and the complexity model fitted to the timings.
+# The brute force models describe the brute force solvers, so those
+# engines are the ones timed.
+benchmarks = {
+	'optimal_purchase_plan': (functools.partial(first.optimal_purchase_plan, engine='brute_force'), first.random_instance, [4, 6, 8, 10, 12, 14, 16], first.complexity_equation),
+	'brute_force_packing': (second.brute_force_packing, packing_instance, [4, 5, 6, 7, 8, 9], second.exponentiation),
+	'first_fit': (second.first_fit, packing_instance, [100, 200, 400, 800, 1600, 3200], n_log_n),
+	'find_recurrent_pattern': (functools.partial(third.find_recurrent_pattern, engine='brute_force'), recurrent_pattern_instance, [250, 500, 1000, 2000], linear),
+}
+
+#------------------- MEASUREMENTS --------------------
+
+def measure(function, arguments, warmup=1, repeats=5):
+  # Given a function and its arguments, the function runs it warmup
+  # times without timing it, then repeats times measuring each run with
+  # time.perf_counter, and finally once more under tracemalloc (tracing
+  # slows the code down, so it is kept apart from the timings).
+  # It returns the mean time, its standard deviation, the half-width of
+  # the 95% confidence interval of the mean (Student's t) and the peak
+  # memory allocated by the run, in bytes.
+	for i in range(warmup):
+		function(*arguments)
+	times = []
+	for i in range(repeats):
+		start = time.perf_counter()
+		function(*arguments)
+		times.append(time.perf_counter() - start)
+	tracemalloc.start()
+	try:
+		function(*arguments)
+		peak_memory = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+	mean = statistics.mean(times)
+	deviation = statistics.stdev(times) if repeats > 1 else 0.0
+	confidence = scipy.stats.t.ppf(0.975, repeats - 1) * deviation / math.sqrt(repeats) if repeats > 1 else 0.0
+	return {'mean': mean, 'stdev': deviation, 'ci95': confidence, 'peak_memory': peak_memory}
+
+def fit_complexity(model, sizes, times):
+  # Fits the complexity model to the mean times, as the original
+  # scripts did with curve_fit; returns None when it does not converge
+	try:
+		parameters = optimization.curve_fit(model, sizes, times, maxfev=10000)[0]
+	except (RuntimeError, ValueError, TypeError, OverflowError):
+		return None
+	if not all(math.isfinite(p) for p in parameters): return None
+	return [float(p) for p in parameters]
+
+def run_benchmarks(names=None, seed=0, warmup=1, repeats=5):
+  # Given the names of the benchmarks to run (by default all of them),
+  # the function measures each function on every size of its sweep.
+  # Instance n of a benchmark is always drawn with the same seed, so
+  # different runs time the same inputs.
+	results = dict()
+	for name in names or benchmarks:
+		function, instance, sizes, model = benchmarks[name]
+		measurements = []
+		for n in sizes:
+			arguments = instance(n, random.Random(f'{seed}-{name}-{n}'))
+			measurement = measure(function, arguments, warmup, repeats)
+			measurement['n'] = n
+			measurements.append(measurement)
+			print(f'{name} n={n}: {measurement["mean"]:.6f} s +/- {measurement["ci95"]:.6f}, peak {measurement["peak_memory"]} bytes')
+		results[name] = {
+			'measurements': measurements,
+			'model': model.__name__,
+			'parameters': fit_complexity(model, sizes, [m['mean'] for m in measurements]),
+		}
+	return {'seed': seed, 'warmup': warmup, 'repeats': repeats, 'results': results}
+
+#------------------- BASELINE COMPARISON --------------------
+
+def compare_with_baseline(report, baseline, tolerance=0.25):
+  # Given two outputs of run_benchmarks, the function returns the list of
+  # (benchmark, n, baseline mean, current mean) for the sizes measured
+  # in both that became slower by more than the tolerance (a fraction),
+  # beyond the noise: the two 95% confidence intervals must not overlap.
+	regressions = []
+	for name, result in report['results'].items():
+		if name not in baseline['results']: continue
+		old_measurements = {m['n']: m for m in baseline['results'][name]['measurements']}
+		for new in result['measurements']:
+			old = old_measurements.get(new['n'])
+			if old is None: continue
+			if new['mean'] > old['mean'] * (1 + tolerance) and new['mean'] - new['ci95'] > old['mean'] + old['ci95']:
+				regressions.append((name, new['n'], old['mean'], new['mean']))
+	return regressions
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Benchmark the solvers of the three assignments.')
+	parser.add_argument('names', nargs='*', help='benchmarks to run, among ' + ', '.join(benchmarks) + ' (default: all)')
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--warmup', type=int, default=1)
+	parser.add_argument('--repeats', type=int, default=5)
+	parser.add_argument('--output', help='JSON file where the results are written')
+	parser.add_argument('--baseline', help='JSON file of a previous run to compare with')
+	parser.add_argument('--tolerance', type=float, default=0.25)
+	arguments = parser.parse_args()
+	for name in arguments.names:
+		if name not in benchmarks: parser.error('unknown benchmark: ' + name)
+
+	report = run_benchmarks(arguments.names, arguments.seed, arguments.warmup, arguments.repeats)
+	if arguments.output:
+		with open(arguments.output, 'w') as file:
+			json.dump(report, file, indent=1)
+	if arguments.baseline:
+		with open(arguments.baseline) as file:
+			regressions = compare_with_baseline(report, json.load(file), arguments.tolerance)
+		for name, n, old, new in regressions:
+			print(f'REGRESSION {name} n={n}: {old:.6f} s -> {new:.6f} s')
+		if regressions: sys.exit(1)
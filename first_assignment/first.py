@@ -1,4 +1,15 @@
-import random, timeit, numpy, scipy.optimize as op
+import random, timeit, os, itertools, contextlib, numpy, scipy.optimize as op
+from concurrent.futures import ProcessPoolExecutor
+
+# Optional instrumentation (see instrumentation.py in the main folder):
+# when monitor is not None, the solvers count the subsets they enumerate
+# and prune and the calls to compatible(), time their phases and report
+# their progress to it. Left to None it costs one check per step.
+monitor = None
+
+def timed_phase(name):
+  # Times a phase of a solver when the monitor is on
+	return monitor.phase(name) if monitor is not None else contextlib.nullcontext()
 
 def all_possible_combinations(suppliers, weights):
   # DEFINE THE SEARCH SPACE
@@ -25,13 +36,351 @@ def compatible(choices, L):
   # corresponding incompatibilities, the funcion convert the
   # list of suppliers in a set and with a hash lookup checks 
   # if there are any incompatibilities
+	if monitor is not None: monitor.count('compatible_calls')
 	set_of_choices = set(choices)
 	for supplier in choices:
 		for incompatible in L[supplier]:
 			if incompatible in set_of_choices:
 				return False
 	return True
-def optimal_purchase_plan(suppliers, weights, incompatibilities):
+def brute_force_purchase_plan(suppliers, weights, incompatibilities):
+  # EXHAUSTIVE SEARCH
+  # Scans the whole search space produced by all_possible_combinations()
+  # and keeps the first compatible combination with the highest weight.
+  # It is kept as the reference solver: every other engine must return
+  # the same purchase plan.
+	best_combination = []
+	max_weight = 0.0
+	with timed_phase('search_space'):
+		combinations = all_possible_combinations(suppliers, weights)
+	with timed_phase('scan'):
+		for done, combination in enumerate(combinations, 1):
+			if monitor is not None:
+				monitor.count('subsets_enumerated')
+				monitor.progress(done, len(combinations), 'brute_force_purchase_plan')
+			if combination[1] > max_weight:
+				if compatible(combination[0], incompatibilities):
+					best_combination = combination[0]
+					max_weight = combination[1]
+			elif monitor is not None: monitor.count('subsets_pruned')
+	return best_combination
+
+def conflict_masks(suppliers, incompatibilities):
+  # CONFLICT GRAPH
+  # Given the list of suppliers and the dictionary with their
+  # incompatibilities, the function numbers the suppliers by their
+  # position in the list and returns a list of integers used as
+  # bitmasks: bit j of the i-th mask is set when suppliers i and j
+  # cannot be purchased together. The relation is made symmetric
+  # (compatible() rejects a pair if either of the two lists the other)
+  # and identifiers that are not suppliers are ignored. A supplier
+  # that is incompatible with itself has its own bit set.
+	position = {supplier: i for i, supplier in enumerate(suppliers)}
+	masks = [0] * len(suppliers)
+	for i, supplier in enumerate(suppliers):
+		for incompatible in incompatibilities[supplier]:
+			j = position.get(incompatible)
+			if j is not None:
+				masks[i] |= 1 << j
+				masks[j] |= 1 << i
+	return masks
+
+def branch_and_bound_purchase_plan(suppliers, weights, incompatibilities):
+  # MAXIMUM WEIGHT INDEPENDENT SET
+  # The suppliers are the vertices of the conflict graph and a purchase
+  # plan is an independent set of it. The search grows the prefixes
+  # suppliers[:k+1] one supplier at a time (as in Ostergard's algorithm)
+  # and stores in best_in_prefix[k] the optimal weight that can be
+  # obtained from the first k+1 suppliers. While looking for a plan
+  # whose last supplier is k, a partial plan with candidates up to
+  # position j can gain at most best_in_prefix[j], so every branch that
+  # cannot beat the current best plan is pruned. When that bound is not
+  # enough, the remaining candidates are covered greedily, heaviest
+  # first, by cliques of the conflict graph: a supplier joins the
+  # cliques it conflicts with entirely, using up their values, and what
+  # is left of its weight opens a new clique (splitting the last one if
+  # it has more than needed). A plan takes at most one supplier from
+  # each clique, so it gains at most the sum of their values. With this
+  # bound 100 suppliers with 10 conflicts each take about a second;
+  # the search is still exponential, and very sparse graphs are the
+  # hardest (100 suppliers with 2-5 conflicts each take 10-25 seconds).
+  # Candidates are tried in increasing position and a plan replaces the
+  # best one only if it is strictly heavier, so that the plan found is
+  # the same one all_possible_combinations() would have met first; the
+  # weights are summed in the order of the suppliers list for the same
+  # reason. Only the current branch is kept in memory.
+	n = len(suppliers)
+	masks = conflict_masks(suppliers, incompatibilities)
+	w = [weights[supplier] for supplier in suppliers]
+	allowed = sum(1 << i for i in range(n) if not masks[i] >> i & 1)
+	by_weight = sorted(range(n), key=lambda i: -w[i])
+	tolerance = 1e-9 * (1.0 + sum(abs(weight) for weight in w))
+	best_in_prefix = [0.0] * n
+	best_plan = []
+	max_weight = 0.0
+	chosen = []
+
+	def cover_bound(candidates, limit):
+	  # Sum of the clique values, returned as soon as it exceeds limit;
+	  # suppliers without a positive weight cannot make a plan heavier
+		cliques = []
+		total = 0.0
+		for v in by_weight:
+			if candidates >> v & 1 and w[v] > 0.0:
+				residual = w[v]
+				for clique in cliques:
+					if clique[0] >> v & 1:
+						if clique[1] <= residual:
+							clique[0] &= masks[v]
+							residual -= clique[1]
+						else:
+							cliques.append([clique[0] & masks[v], residual])
+							clique[1] -= residual
+							residual = 0.0
+							break
+				if residual > 0.0:
+					cliques.append([masks[v], residual])
+					total += residual
+					if total > limit:
+						return total
+		return total
+
+	def promising(weight, candidates):
+		bound = weight
+		if candidates:
+			bound += best_in_prefix[candidates.bit_length() - 1]
+			if bound > max_weight:
+				limit = max_weight - weight - tolerance
+				return cover_bound(candidates, limit) > limit
+		return bound > max_weight
+
+	def extend(candidates):
+		nonlocal best_plan, max_weight
+		to_try = candidates
+		while to_try:
+			low = to_try & -to_try
+			j = low.bit_length() - 1
+			to_try ^= low
+			chosen.append(j)
+			remaining = candidates & (low - 1) & ~masks[j]
+			if monitor is not None: monitor.count('subsets_enumerated')
+			if promising(sum(w[i] for i in reversed(chosen)), remaining):
+				extend(remaining)
+			elif monitor is not None: monitor.count('subsets_pruned')
+			chosen.pop()
+		weight = sum(w[i] for i in reversed(chosen))
+		if weight > max_weight:
+			best_plan = chosen[::-1]
+			max_weight = weight
+
+	for k in range(n):
+		if allowed >> k & 1:
+			chosen.append(k)
+			candidates = allowed & ((1 << k) - 1) & ~masks[k]
+			if monitor is not None: monitor.count('subsets_enumerated')
+			if promising(w[k], candidates):
+				extend(candidates)
+			elif monitor is not None: monitor.count('subsets_pruned')
+			chosen.pop()
+		best_in_prefix[k] = max_weight
+		if monitor is not None: monitor.progress(k + 1, n, 'branch_and_bound_purchase_plan')
+	return [suppliers[i] for i in best_plan]
+
+def precedes(mask1, mask2):
+  # ENUMERATION ORDER
+  # Given two subsets of suppliers encoded as bitmasks (bit i stands
+  # for the i-th supplier), the function returns True if mask1 is
+  # generated before mask2 by all_possible_combinations(). That
+  # function emits the subsets ordered by their last supplier and,
+  # for the same last supplier, in the order of the remaining ones,
+  # so two subsets are compared at the highest supplier in which they
+  # differ: the subset that still has a lower supplier to offer comes
+  # first. It is used to break ties exactly as the brute force does.
+	difference = mask1 ^ mask2
+	if not difference:
+		return False
+	highest = difference.bit_length() - 1
+	below = (1 << highest) - 1
+	if mask1 >> highest & 1:
+		return not mask2 & below
+	return bool(mask1 & below)
+
+def gray_code_subsets(positions, masks, w):
+  # GRAY CODE WALK
+  # Given a list of supplier positions, the conflict masks and the
+  # list of weights, the generator visits every subset of those
+  # positions in Gray code order, so that two consecutive subsets
+  # differ by a single supplier. The total weight and the number of
+  # incompatible pairs inside the subset are updated in constant time
+  # when that supplier enters or leaves (a bitwise AND with its
+  # conflict mask and a popcount). Only the compatible subsets, i.e.
+  # the ones without incompatible pairs, are yielded together with
+  # their (running) weight; the empty subset comes first.
+	subset, weight, conflicts = 0, 0.0, 0
+	yield subset, weight
+	for step in range(1, 1 << len(positions)):
+		i = positions[(step & -step).bit_length() - 1]
+		if subset >> i & 1:
+			conflicts -= bin(masks[i] & subset).count('1')
+			subset ^= 1 << i
+			weight -= w[i]
+		else:
+			subset |= 1 << i
+			conflicts += bin(masks[i] & subset).count('1')
+			weight += w[i]
+		if not conflicts:
+			yield subset, weight
+
+def gray_code_search(masks, w, start, prefix):
+  # BITMASK EXHAUSTIVE SEARCH
+  # Given the conflict masks and the list of weights, the function
+  # searches the subsets whose suppliers in positions [0, start) are
+  # exactly the ones of the bitmask prefix, and returns the best of
+  # them as a (bitmask, weight) pair ((0, 0.0) if none is heavier than
+  # nothing). The free suppliers are split in two halves: the compatible
+  # subsets of the lower half are collected once with gray_code_subsets(),
+  # then the subsets of the upper half are walked in Gray code order and,
+  # for each compatible one, the union of the conflict masks of its
+  # members tells with a single AND which subsets of the lower half can
+  # join it. In this way every subset is checked, but the incompatible
+  # ones are discarded in blocks and no list or set is built.
+  # The running weights may drift by a few ulps, so every compatible
+  # subset close to the best one is re-summed in the order of the
+  # suppliers list and compared with precedes() to keep the result
+  # identical to the brute force.
+	n = len(w)
+	tolerance = 1e-9 * (1.0 + sum(abs(x) for x in w))
+	prefix_forbidden = 0
+	for i in range(start):
+		if prefix >> i & 1:
+			prefix_forbidden |= masks[i]
+	if prefix & prefix_forbidden:
+		return 0, 0.0
+	prefix_weight = sum(w[i] for i in range(start) if prefix >> i & 1)
+	middle = (start + n) // 2
+	low_subsets = [(low_subset, low_weight)
+		for low_subset, low_weight in gray_code_subsets(range(start, middle), masks, w)
+		if not low_subset & prefix_forbidden]
+	best_subset, max_weight = 0, 0.0
+	for high_subset, high_weight in gray_code_subsets(range(middle, n), masks, w):
+		if monitor is not None: monitor.count('subsets_enumerated', len(low_subsets))
+		if high_subset & prefix_forbidden:
+			if monitor is not None: monitor.count('subsets_pruned', len(low_subsets))
+			continue
+		forbidden = 0
+		for i in range(middle, n):
+			if high_subset >> i & 1:
+				forbidden |= masks[i]
+		high_weight += prefix_weight
+		for low_subset, low_weight in low_subsets:
+			if not low_subset & forbidden and high_weight + low_weight > max_weight - tolerance:
+				subset = prefix | high_subset | low_subset
+				exact_weight = sum(w[j] for j in range(n) if subset >> j & 1)
+				if exact_weight > max_weight or (exact_weight == max_weight
+						and best_subset and precedes(subset, best_subset)):
+					best_subset, max_weight = subset, exact_weight
+	return best_subset, max_weight
+
+def gray_code_purchase_plan(suppliers, weights, incompatibilities):
+  # Same search space of brute_force_purchase_plan(), walked with
+  # integer bitmasks by gray_code_search() with no supplier fixed.
+	masks = conflict_masks(suppliers, incompatibilities)
+	w = [weights[supplier] for supplier in suppliers]
+	best_subset, _ = gray_code_search(masks, w, 0, 0)
+	return [suppliers[j] for j in range(len(suppliers)) if best_subset >> j & 1]
+
+def parallel_purchase_plan(suppliers, weights, incompatibilities, workers=None):
+  # PARALLEL EXHAUSTIVE SEARCH
+  # The search space is split in 2^fixed shards by fixing whether each
+  # of the first "fixed" suppliers is purchased or not, with at least
+  # four shards per worker to balance the load. The shards are searched
+  # by gray_code_search() in a pool of processes (workers defaults to the
+  # number of cores) and the per-shard best (bitmask, weight) pairs are
+  # reduced with the same rule used inside a shard, i.e. a heavier plan
+  # wins and equal weights are decided by precedes(), so the result is
+  # the one of the serial engines whatever the number of workers.
+	n = len(suppliers)
+	masks = conflict_masks(suppliers, incompatibilities)
+	w = [weights[supplier] for supplier in suppliers]
+	workers = workers or os.cpu_count() or 1
+	fixed = min(n, (4 * workers - 1).bit_length())
+	best_subset, max_weight = 0, 0.0
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		shards = pool.map(gray_code_search, itertools.repeat(masks), itertools.repeat(w),
+			itertools.repeat(fixed), range(1 << fixed))
+		for subset, weight in shards:
+			if weight > max_weight or (weight == max_weight
+					and best_subset and precedes(subset, best_subset)):
+				best_subset, max_weight = subset, weight
+	return [suppliers[j] for j in range(n) if best_subset >> j & 1]
+
+def subset_tables(positions, masks, w, shift):
+  # SUBSETS OF ONE HALF
+  # Given the positions of a block of consecutive suppliers, the
+  # conflict masks, the list of weights and the position of the other
+  # half (shift), the function returns three numpy arrays indexed by
+  # the 2^len(positions) subsets of the block: their total weight,
+  # whether they are compatible and the bitmask of the suppliers from
+  # position shift onwards that are incompatible with at least one of
+  # their members. Each table is filled doubling its length: the
+  # subsets containing the t-th supplier of the block are the ones
+  # without it plus that supplier.
+	size = 1 << len(positions)
+	first = positions[0] if positions else 0
+	weight = numpy.zeros(size)
+	valid = numpy.ones(size, dtype=bool)
+	forbidden = numpy.zeros(size, dtype=numpy.int64)
+	for t, i in enumerate(positions):
+		lower = numpy.arange(1 << t, dtype=numpy.int64)
+		inside = (masks[i] >> first) & ((1 << t) - 1)
+		weight[1 << t:2 << t] = weight[:1 << t] + w[i]
+		valid[1 << t:2 << t] = valid[:1 << t] & ((lower & inside) == 0) & (not masks[i] >> i & 1)
+		forbidden[1 << t:2 << t] = forbidden[:1 << t] | (masks[i] >> shift)
+	return weight, valid, forbidden
+
+def meet_in_the_middle_purchase_plan(suppliers, weights, incompatibilities):
+  # MEET IN THE MIDDLE
+  # The suppliers are split in two halves and subset_tables() lists the
+  # 2^(n/2) subsets of each one. For the second half, a sum over subsets
+  # dynamic programming turns the weights of its compatible subsets into
+  # best[allowed], the heaviest compatible subset contained in the
+  # bitmask allowed (one pass per supplier: a mask inherits the best of
+  # the same mask without that supplier). Then every compatible subset
+  # of the first half is completed in constant time with best[] of the
+  # second-half suppliers it does not conflict with. Time and memory are
+  # O(2^(n/2)*n) instead of O(2^n). The optimal weight is the one of the
+  # brute force; if several plans are exactly as heavy, a different one
+  # of them may be returned.
+	n = len(suppliers)
+	masks = conflict_masks(suppliers, incompatibilities)
+	w = [weights[supplier] for supplier in suppliers]
+	half = n // 2
+	with timed_phase('subset_tables'):
+		first_weight, first_valid, forbidden = subset_tables(list(range(half)), masks, w, half)
+		best, second_valid, _ = subset_tables(list(range(half, n)), masks, w, n)
+	if monitor is not None:
+		monitor.count('subsets_enumerated', first_weight.size + best.size)
+		monitor.count('subsets_pruned', int((~first_valid).sum() + (~second_valid).sum()))
+	with timed_phase('sum_over_subsets'):
+		best[~second_valid] = -numpy.inf
+		choice = numpy.arange(best.size, dtype=numpy.int64)
+		for t in range(n - half):
+			with_supplier = best.reshape(-1, 2, 1 << t)[:, 1, :]
+			without_supplier = best.reshape(-1, 2, 1 << t)[:, 0, :]
+			improves = without_supplier > with_supplier
+			with_supplier[improves] = without_supplier[improves]
+			choice_with = choice.reshape(-1, 2, 1 << t)[:, 1, :]
+			choice_with[improves] = choice.reshape(-1, 2, 1 << t)[:, 0, :][improves]
+	with timed_phase('combine'):
+		allowed = ~forbidden & ((1 << (n - half)) - 1)
+		total = numpy.where(first_valid, first_weight + best[allowed], -numpy.inf)
+		first_subset = int(numpy.argmax(total))
+	if not total[first_subset] > 0.0:
+		return []
+	subset = first_subset | int(choice[allowed[first_subset]]) << half
+	return [suppliers[j] for j in range(n) if subset >> j & 1]
+
+def optimal_purchase_plan(suppliers, weights, incompatibilities, engine='branch_and_bound', workers=None):
   # Input:
   # - suppliers: a list containing hashable objects (e.g. strings 
   #            or integers) that represent the identifiers
@@ -42,37 +391,48 @@ def optimal_purchase_plan(suppliers, weights, incompatibilities):
   # - incompatibilities: a dictionary mapping each identifier
   #            to the set (or list) of the identifiers of the suppliers
   #            that are incompatible with it
+  # - engine: the solver to be used, "branch_and_bound" (default),
+  #            "meet_in_the_middle", "gray_code", "parallel" or
+  #            "brute_force"
+  # - workers: the number of processes used by the "parallel" engine
+  #            (by default, one per core)
   # Output:
   #            a list of identifiers of pairwise compatible
   #            suppliers that provide maximal total weight
-	best_combination = []
-	max_weight = 0.0
-	for combination in all_possible_combinations(suppliers, weights):
-		if combination[1] > max_weight:
-			if compatible(combination[0], incompatibilities):
-				best_combination = combination[0]
-				max_weight = combination[1]
-	return best_combination #to see also the corresponding purchased grams of substance use "return (best_combination, max_weight)"
-
-lengths=[4,8,10,12,14,16,18,20,22,24]
-def testing_routine(n):
-  # Given the number of suppliers n, the function 
-  # test optimal_purchase_plan() on randomly generated inputs
-  # that consider all the constraints defined in the assignement
+	if engine == 'branch_and_bound':
+		return branch_and_bound_purchase_plan(suppliers, weights, incompatibilities)
+	if engine == 'meet_in_the_middle':
+		return meet_in_the_middle_purchase_plan(suppliers, weights, incompatibilities)
+	if engine == 'parallel':
+		return parallel_purchase_plan(suppliers, weights, incompatibilities, workers)
+	if engine == 'gray_code':
+		return gray_code_purchase_plan(suppliers, weights, incompatibilities)
+	if engine == 'brute_force':
+		return brute_force_purchase_plan(suppliers, weights, incompatibilities)
+	raise ValueError('Unknown engine: ' + str(engine))
+
+lengths=[4,6,8,10,12,14,16,18]
+def random_instance(n, generator=random):
+  # Given the number of suppliers n, the function generates a random
+  # input of optimal_purchase_plan() that considers all the constraints
+  # defined in the assignement (the random numbers are drawn from
+  # generator, e.g. a seeded random.Random)
 	suppliers=list(range(n))
 	weights, incompatibilities = dict(), dict()
 	for s_i in suppliers:
-		weights[s_i] = random.uniform(0,1)
+		weights[s_i] = generator.uniform(0,1)
 		tc_suppliers = set(suppliers) #temporary copy of suppliers in the form of a set
 		tc_suppliers.discard(s_i)
-		incompatibles_for_s_i = set(random.sample(tc_suppliers,n//2))
+		incompatibles_for_s_i = set(generator.sample(sorted(tc_suppliers),n//2))
 		incompatibilities[s_i] = incompatibles_for_s_i
-	return optimal_purchase_plan(suppliers, weights, incompatibilities)
+	return suppliers, weights, incompatibilities
 
-for n in lengths:
-	print('Number of suppliers:',n)
-	print('The optimal purchase plan to be selected is: ',end=' ')
-	print(testing_routine(n))
+def testing_routine(n):
+  # Given the number of suppliers n, the function 
+  # test optimal_purchase_plan() on randomly generated inputs
+  # that consider all the constraints defined in the assignement.
+  # The brute force engine is the one complexity_equation describes
+	return optimal_purchase_plan(*random_instance(n), engine='brute_force')
 
 def runtime(function, lengths):
   # RUNTIME TESTING
@@ -86,12 +446,6 @@ def runtime(function, lengths):
 			number=10, setup="from __main__ import "+function+",random")/10)
 	return average
 
-data=runtime("testing_routine",lengths)
-
-print('Coordinates\n')
-for (x,y) in zip(lengths,data):
-	print((x,y),end=' ')
-
 def complexity_equation(n,a,b):
   # Define the parametric relationship corresponding to the
   # time complexity of optimal_purchase_plan()
@@ -99,6 +453,20 @@ def complexity_equation(n,a,b):
   # a and b are the parameters
 	return a*((2**n)*(n**2))+b
 
-variable=op.curve_fit(complexity_equation,lengths,data)
-print('\nParameters\n')
-print(variable)
+# The experiments run only when the file is executed, so that importing
+# it (e.g. from benchmark_suite.py) does not take minutes.
+if __name__ == '__main__':
+	for n in lengths:
+		print('Number of suppliers:',n)
+		print('The optimal purchase plan to be selected is: ',end=' ')
+		print(testing_routine(n))
+
+	data=runtime("testing_routine",lengths)
+
+	print('Coordinates\n')
+	for (x,y) in zip(lengths,data):
+		print((x,y),end=' ')
+
+	variable=op.curve_fit(complexity_equation,lengths,data)
+	print('\nParameters\n')
+	print(variable)
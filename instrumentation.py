@@ -0,0 +1,63 @@
+import sys, time, contextlib, collections
+
+# Every assignment module has a global "monitor", None by default, that
+# its solvers check before counting anything. To look inside a run, set
+# it to a SearchMonitor, e.g.:
+#	import first, instrumentation
+#	first.monitor = instrumentation.SearchMonitor(instrumentation.print_progress)
+#	first.optimal_purchase_plan(suppliers, weights, incompatibilities, engine='brute_force')
+#	print(first.monitor.report())
+# The engines that run in a pool of processes only report what happens
+# in the parent process.
+
+class SearchMonitor:
+  # Collects named counters (count), the time spent in each phase of a
+  # solver (phase, a context manager) and progress reports (progress).
+  # The callback, if any, is called with the name of the search, the
+  # units done, their total, the seconds elapsed and the estimated
+  # seconds left (None until it can be estimated), at most once every
+  # interval seconds and when the search is over.
+
+	def __init__(self, callback=None, interval=1.0):
+		self.counters = collections.Counter()
+		self.timers = collections.defaultdict(float)
+		self.callback = callback
+		self.interval = interval
+		self.progress_starts = dict()
+		self.last_report = float('-inf')
+
+	def count(self, name, amount=1):
+		self.counters[name] += amount
+
+	@contextlib.contextmanager
+	def phase(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.timers[name] += time.perf_counter() - start
+
+	def progress(self, done, total, name='search'):
+	  # The rate is measured from the first report of the search, so the
+	  # estimate holds even if the monitor is reused for several runs
+		now = time.perf_counter()
+		start, done_at_start = self.progress_starts.setdefault(name, (now, done))
+		if self.callback is None or (now - self.last_report < self.interval and done < total):
+			return
+		self.last_report = now
+		elapsed = now - start
+		eta = None
+		if done > done_at_start:
+			eta = max(total - done, 0) * elapsed / (done - done_at_start)
+		self.callback(name, done, total, elapsed, eta)
+		if done >= total:
+			del self.progress_starts[name]
+
+	def report(self):
+		return {'counters': dict(self.counters), 'timers': dict(self.timers)}
+
+def print_progress(name, done, total, elapsed, eta):
+  # A callback for SearchMonitor that writes one line per report
+	remaining = 'unknown' if eta is None else f'{eta:.1f} s'
+	percentage = 100 * done / total if total else 100.0
+	print(f'{name}: {done}/{total} ({percentage:.1f}%), {elapsed:.1f} s elapsed, {remaining} left', file=sys.stderr)
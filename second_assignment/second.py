@@ -1,4 +1,15 @@
-import random, timeit, numpy, scipy.optimize as optimization
+import random, timeit, time, math, bisect, os, json, struct, itertools, contextlib, numpy, scipy.optimize as optimization
+from concurrent.futures import ProcessPoolExecutor
+
+# Optional instrumentation (see instrumentation.py in the main folder):
+# when monitor is not None, the brute force counts the partitions it
+# receives and the calls to check_validity, times its phases and
+# reports its progress to it. Left to None it costs one check per step.
+monitor = None
+
+def timed_phase(name):
+  # Times a phase of a solver when the monitor is on
+	return monitor.phase(name) if monitor is not None else contextlib.nullcontext()
 
 #------------------- BRUTE BIN PACKING --------------------
 
@@ -8,6 +19,7 @@ def check_validity(box, weights, capacity):
   # capacity, the function returns True if the selected bin
   # is valid, i.e. the sum of the weights contained in it
   # does not exceed the capacity, otherwise it returns False
+	if monitor is not None: monitor.count('check_validity_calls')
 	weight_sum = 0.
 	for item in box: weight_sum += weights[item]
 	if weight_sum <= capacity:
@@ -54,15 +66,236 @@ def brute_force_packing(number_of_items, weights, capacity):
   # needed to realized the beforementioned packaging.
 	optimal_number_of_bins = number_of_items
 	optimal_packing = [[item] for item in range(number_of_items)]
-	for choice in generate_all_valid_choices(weights, capacity):
-		length_of_current_packing = len(choice)
-		if length_of_current_packing < optimal_number_of_bins:
-			optimal_packing = choice
-			optimal_number_of_bins = length_of_current_packing
+	# The valid partitions are at most the Bell number of the items, so
+	# the progress (and its ETA) is measured against it
+	if monitor is not None: all_partitions = bell_number(number_of_items)
+	with timed_phase('partitions'):
+		for done, choice in enumerate(generate_all_valid_choices(weights, capacity), 1):
+			if monitor is not None:
+				monitor.count('partitions_yielded')
+				monitor.progress(done, all_partitions, 'brute_force_packing')
+			length_of_current_packing = len(choice)
+			if length_of_current_packing < optimal_number_of_bins:
+				optimal_packing = choice
+				optimal_number_of_bins = length_of_current_packing
+	if monitor is not None: monitor.progress(all_partitions, all_partitions, 'brute_force_packing')
 	return optimal_packing, optimal_number_of_bins
 
+def bell_number(n):
+  # Number of partitions of n items, with the Bell triangle
+	row = [1]
+	for i in range(n - 1):
+		next_row = [row[-1]]
+		for value in row: next_row.append(next_row[-1] + value)
+		row = next_row
+	return row[-1]
+
+#------------------- BRANCH AND BOUND BIN PACKING --------------------
+
+def lower_bound(weights, capacity):
+  # MARTELLO-TOTH LOWER BOUND
+  # Given a list of weights (none of them larger than the capacity)
+  # and the capacity, the function returns the L2 lower bound on the
+  # number of bins, which is never smaller than the trivial
+  # L1 = ceil(sum of the weights / capacity) (the case alpha = 0 below).
+  # For every threshold alpha <= capacity/2 the items are split in
+  # J1 (heavier than capacity - alpha), J2 (heavier than capacity/2)
+  # and J3 (at least alpha): no J1 or J2 item can share a bin, no J3 item
+  # fits with a J1 item, so the J3 items need the bins that are left
+  # free by J2 and, for the rest, new ones.
+  # A small tolerance keeps the rounding errors from overestimating it.
+	half = capacity / 2
+	thresholds = {0.}
+	for weight in weights:
+		if weight <= half: thresholds.add(weight)
+	best = 0
+	for alpha in thresholds:
+		J1 = J2 = 0
+		J2_sum = J3_sum = 0.
+		for weight in weights:
+			if weight > capacity - alpha: J1 += 1
+			elif weight > half:
+				J2 += 1
+				J2_sum += weight
+			elif weight >= alpha: J3_sum += weight
+		excess = (J3_sum - (J2 * capacity - J2_sum)) / capacity
+		bound = J1 + J2 + max(0, math.ceil(excess - 1e-9))
+		if bound > best: best = bound
+	return best
+
+def branch_and_bound_packing(number_of_items, weights, capacity):
+  # EXACT BIN PACKING
+  # Same input and output of brute_force_packing(), but instead of
+  # generating every partition, the bins are filled one at a time (bin
+  # completion, as in Korf's algorithm): each new bin takes the heaviest
+  # item left and one of the sets of the other items that can complete it.
+  # - the incumbent (best packing found so far) starts from the First Fit
+  #   solution of the sorted items (First Fit Decreasing) and the search
+  #   stops as soon as it meets the lower_bound() of the instance;
+  # - a branch is pruned when the bins already filled plus the
+  #   lower_bound() of the items left cannot beat the incumbent, or when
+  #   the space wasted by the filled bins is more than the incumbent
+  #   minus one bin allows;
+  # - only the completions that no other one dominates are tried: a bin
+  #   with room for one more of the items left, or in which an item left
+  #   could replace one or two lighter items, is never better than the
+  #   bin with that item, since the lighter items fit where it would go.
+  #   The completions are tried from the fullest one.
+  # An item fits in a bin when check_validity() accepts the bin with the
+  # item added, i.e. when the load summed in the order of the items is at
+  # most the capacity: subtracting from the remaining space instead would
+  # round differently (1 - 0.8 < 0.2) and reject packings that
+  # brute_force_packing() accepts. The bounds keep a small tolerance, so
+  # they never prune a packing for a rounding error.
+  # Items heavier than the capacity get a bin of their own, as in
+  # brute_force_packing().
+  # The search is still exponential: the instances of benchmarking_routine()
+  # (C = sqrt(n)) take milliseconds, and so do most of the C = 1 ones of
+  # approximation_ratio_trial(), where First Fit Decreasing often misses
+  # the lower bound. With C = 1, 40 items take at most about 0.3 seconds
+  # and 60 items a few seconds, but around one instance out of twenty
+  # with 100 items takes from 15 seconds to about a minute.
+	order = decreasing_order(weights)
+	oversized = sum(1 for item in order if weights[item] > capacity)
+	items = order[oversized:]
+	bound = oversized + lower_bound([weights[item] for item in items], capacity)
+	total_weight = sum(weights[item] for item in items)
+	tolerance = 1e-9 * (1 + total_weight / capacity) * capacity
+
+	def load(box):
+	  # The load of a bin (a list of items in increasing order), summed as check_validity() does
+		return sum(weights[item] for item in box)
+
+	def fits(box, item):
+		return load(sorted(box + [item])) <= capacity
+
+  # First Fit Decreasing with the same test, as the first incumbent
+	contents = []
+	for item in items:
+		for box in contents:
+			if fits(box, item):
+				bisect.insort(box, item)
+				break
+		else:
+			contents.append([item])
+	best_packing = [[item] for item in order[:oversized]] + contents
+	best_number_of_bins = len(best_packing)
+	filled = []
+
+	def dominated(box, heaviest, excluded):
+	  # True when an excluded item can replace one or two lighter items
+	  # of the bin (other than its heaviest item) and still fit
+		others = [item for item in box if item != heaviest]
+		for item in excluded:
+			for replaced in itertools.chain(itertools.combinations(others, 1), itertools.combinations(others, 2)):
+				if sum(weights[other] for other in replaced) + tolerance < weights[item]:
+					if load(sorted([other for other in box if other not in replaced] + [item])) <= capacity: return True
+		return False
+
+	def completions(heaviest, rest, minimum_load):
+	  # The undominated bins made of the heaviest item and some of the
+	  # rest (in decreasing order), whose load is at least minimum_load
+		suffix_weight = [0.] * (len(rest) + 1)
+		for position in range(len(rest) - 1, -1, -1):
+			suffix_weight[position] = suffix_weight[position + 1] + weights[rest[position]]
+		found = []
+		excluded = []
+
+		def choose(position, box, box_load):
+			if box_load + suffix_weight[position] < minimum_load: return
+			if position == len(rest):
+				if any(fits(box, item) for item in excluded) or dominated(box, heaviest, excluded): return
+				found.append((box_load, box))
+				return
+			item = rest[position]
+			with_item = sorted(box + [item])
+			with_item_load = load(with_item)
+			if with_item_load <= capacity:
+				choose(position + 1, with_item, with_item_load)
+			excluded.append(item)
+			choose(position + 1, box, box_load)
+			excluded.pop()
+
+		choose(0, [heaviest], weights[heaviest])
+		found.sort(key=lambda completion: -completion[0])
+		return found
+
+	def fill(remaining, waste):
+	  # Returns True when the incumbent has reached the lower bound
+		nonlocal best_number_of_bins, best_packing
+		if not remaining:
+			best_number_of_bins = oversized + len(filled)
+			best_packing = [[item] for item in order[:oversized]] + [box[:] for box in filled]
+			return best_number_of_bins == bound
+		if oversized + len(filled) + lower_bound([weights[item] for item in remaining], capacity) >= best_number_of_bins:
+			return False
+		heaviest, rest = remaining[0], remaining[1:]
+		allowed_waste = (best_number_of_bins - 1 - oversized) * capacity - total_weight + tolerance
+		for box_load, box in completions(heaviest, rest, capacity - (allowed_waste - waste)):
+			allowed_waste = (best_number_of_bins - 1 - oversized) * capacity - total_weight + tolerance
+			if waste + capacity - box_load > allowed_waste: break
+			filled.append(box)
+			packed = set(box)
+			found = fill([item for item in rest if item not in packed], waste + capacity - box_load)
+			filled.pop()
+			if found: return True
+		return False
+
+	if best_number_of_bins > bound:
+		fill(items, 0.)
+	return best_packing, best_number_of_bins
+
 #------------------- FIRST FIT BIN PACKING --------------------
 
+def capacity_tree(size, capacity):
+  # TOURNAMENT TREE OF THE REMAINING CAPACITIES
+  # Given the number of bins and the capacity, the function returns a
+  # list representing a complete binary tree: the leaves (from position
+  # len(tree)//2 onwards) store the remaining space of each bin, every
+  # internal node the maximum of its two children, so the root
+  # (position 1) is the largest remaining space. Bins that have not been
+  # opened yet are empty, i.e. they have the whole capacity available.
+	leaves = 1
+	while leaves < size: leaves *= 2
+	return [capacity] * (2 * leaves)
+
+def grow_capacity_tree(tree, capacity):
+  # Returns a tree with twice as many leaves, the old bins followed by
+  # empty ones, rebuilding the internal nodes bottom-up: doubling keeps
+  # the cost of the growth constant per bin and the tree proportional
+  # to the number of bins actually used.
+	leaves = len(tree) // 2
+	new_tree = capacity_tree(2 * leaves, capacity)
+	new_tree[2 * leaves:3 * leaves] = tree[leaves:]
+	for node in range(2 * leaves - 1, 0, -1):
+		new_tree[node] = max(new_tree[2 * node], new_tree[2 * node + 1])
+	return new_tree
+
+def update_capacity_tree(tree, box, remaining_space):
+  # Sets the remaining space of the selected bin and updates the
+  # maxima on the path towards the root, stopping as soon as one
+  # of them does not change: O(log n)
+	node = len(tree) // 2 + box
+	tree[node] = remaining_space
+	node //= 2
+	while node:
+		maximum = max(tree[2 * node], tree[2 * node + 1])
+		if tree[node] == maximum: break
+		tree[node] = maximum
+		node //= 2
+
+def first_fitting_box(tree, weight):
+  # Returns the leftmost bin whose remaining space is at least weight,
+  # or None if there is no such bin: starting from the root, the search
+  # goes to the left child whenever its maximum is large enough. O(log n)
+	if tree[1] < weight: return None
+	node = 1
+	leaves = len(tree) // 2
+	while node < leaves:
+		node *= 2
+		if tree[node] < weight: node += 1
+	return node - leaves
+
 def first_fit(number_of_items, weights, capacity):
   # GREEDY IMPLEMENTATION OF THE BIN PACKING PROBLEM
   # Given the number of items (an integer), the list containing
@@ -73,28 +306,167 @@ def first_fit(number_of_items, weights, capacity):
   # item in the first bin that has enough room for it and if 
   # there is no bin able to contain it the function creates
   # a new bin.
+  # The remaining spaces are kept in a capacity_tree(), so the first bin
+  # with enough room is found in O(log(bins)) instead of scanning all the
+  # open bins: the first empty bin always fits when the open ones do not.
   # INITIALIZATION
-	box_packing = [set() for i in range(number_of_items)]
+	box_packing = []
 	boxes = 0
-	box_remaining_space = [capacity] * number_of_items
-	# there can be at most "number_of_items" bins
-	already_used_items = set()  # initialized to an empty set to perform an HASH LOOKUP later on
+	tree = capacity_tree(1, capacity)
   # PACKING (placing the items one by one in the order they are provided)
 	for item in range(number_of_items):
-		for box in range(boxes):
-			if box_remaining_space[box] >= weights[item]:
-				box_packing[box].add(item)
-				already_used_items.add(item)
-				box_remaining_space[box] -= weights[item] # update the remaining space in the current space removing the weight of the used item
-				break
-		if item not in already_used_items:
-			box_remaining_space[boxes] = capacity - weights[item]  # assign the item to a new bin
-			already_used_items.add(item)
-			box_packing[boxes].add(item)
+		box = first_fitting_box(tree, weights[item])
+		if box is None or box == boxes:
+			box = boxes  # assign the item to a new bin (also when it exceeds the capacity)
+			if boxes == len(tree) // 2: tree = grow_capacity_tree(tree, capacity)
+			box_packing.append(set())
+			boxes += 1
+		box_packing[box].add(item)
+		update_capacity_tree(tree, box, tree[len(tree) // 2 + box] - weights[item]) # update the remaining space in the current space removing the weight of the used item
+	return box_packing, boxes
+
+#------------------- DECREASING AND BEST FIT BIN PACKING --------------------
+
+def decreasing_order(weights):
+  # Returns the indices of the items from the heaviest to the lightest
+  # (items with the same weight keep their original order).
+	return sorted(range(len(weights)), key=lambda item: -weights[item])
+
+def first_fit_decreasing(number_of_items, weights, capacity):
+  # GREEDY IMPLEMENTATION OF THE BIN PACKING PROBLEM
+  # Same input and output of first_fit(): the items are presented to
+  # first_fit() from the heaviest to the lightest and the packing is
+  # translated back to the original item indices.
+	order = decreasing_order(weights)
+	box_packing, boxes = first_fit(number_of_items, [weights[item] for item in order], capacity)
+	return [{order[position] for position in box} for box in box_packing], boxes
+
+def best_fit(number_of_items, weights, capacity):
+  # GREEDY IMPLEMENTATION OF THE BIN PACKING PROBLEM
+  # Same input and output of first_fit(), but every item is placed in
+  # the bin that has the least remaining space among the ones that can
+  # still contain it (the first of them in case of ties), and a new bin
+  # is created only if no bin has enough room.
+  # The open bins are kept in a list of (remaining space, bin) pairs
+  # sorted with bisect, so the best bin is found by binary search in
+  # O(log(bins)) instead of scanning all of them.
+	box_packing = []
+	boxes = 0
+	remaining_space_index = []
+	for item in range(number_of_items):
+		position = bisect.bisect_left(remaining_space_index, (weights[item],))
+		if position < len(remaining_space_index):
+			remaining_space, box = remaining_space_index.pop(position)
+		else:
+			remaining_space, box = capacity, boxes  # assign the item to a new bin
+			box_packing.append(set())
 			boxes += 1
-	while set() in box_packing: box_packing.remove(set())
+		box_packing[box].add(item)
+		bisect.insort(remaining_space_index, (remaining_space - weights[item], box))
 	return box_packing, boxes
 
+def best_fit_decreasing(number_of_items, weights, capacity):
+  # GREEDY IMPLEMENTATION OF THE BIN PACKING PROBLEM
+  # Same input and output of first_fit(): the items are presented to
+  # best_fit() from the heaviest to the lightest and the packing is
+  # translated back to the original item indices.
+	order = decreasing_order(weights)
+	box_packing, boxes = best_fit(number_of_items, [weights[item] for item in order], capacity)
+	return [{order[position] for position in box} for box in box_packing], boxes
+
+#------------------- STREAMING FIRST FIT BIN PACKING --------------------
+
+class StreamingFirstFit:
+  # ONLINE FIRST FIT
+  # First Fit for items that arrive one at a time (e.g. from a queue),
+  # without knowing how many they are. Each item gets the index of its
+  # arrival and is placed in the first open bin with enough room, as in
+  # first_fit(). A bin is closed, and handed to the callback and returned
+  # (or yielded by pack()), as soon as its load reaches fill_threshold
+  # times the capacity, or when it is the oldest of more than
+  # max_open_bins open bins; closed bins no longer receive items.
+  # A closed bin is a (set of item indices, load) pair.
+  # The open bins are the leaves of a capacity_tree(): closing a bin sets
+  # its leaf to -inf, and when the tree is full and at least half of it
+  # is closed it is rebuilt with the open bins only, so memory stays
+  # proportional to the open bins rather than to the items seen.
+  # With the default arguments no bin is closed before flush() and the
+  # packing is the one of first_fit().
+	def __init__(self, capacity, fill_threshold=None, max_open_bins=None, callback=None):
+		self.capacity = capacity
+		self.fill_threshold = fill_threshold
+		self.max_open_bins = max_open_bins
+		self.callback = callback
+		self.number_of_items = 0
+		self.open_bins = 0
+		self.tree = capacity_tree(1, capacity)
+		self.slots = []  # [items, load] for every leaf in use, None once closed
+		self.oldest = 0  # no open bin before this leaf
+
+	def add(self, weight):
+	  # Places one item and returns the list of the bins it caused to close
+		item = self.number_of_items
+		self.number_of_items += 1
+		box = first_fitting_box(self.tree, weight)
+		if box is None or box == len(self.slots):
+			box = self._open_bin()
+		leaf = len(self.tree) // 2 + box
+		self.slots[box][0].add(item)
+		self.slots[box][1] += weight
+		update_capacity_tree(self.tree, box, self.tree[leaf] - weight)
+		closed = []
+		if self.fill_threshold is not None and self.slots[box][1] >= self.fill_threshold * self.capacity:
+			closed.append(self._close(box))
+		if self.max_open_bins is not None and self.open_bins > self.max_open_bins:
+			while self.slots[self.oldest] is None: self.oldest += 1
+			closed.append(self._close(self.oldest))
+		return closed
+
+	def pack(self, weights):
+	  # Generator: consumes any iterable of weights and yields the bins
+	  # as they close, the ones still open at the end included
+		for weight in weights:
+			yield from self.add(weight)
+		yield from self.flush()
+
+	def flush(self):
+	  # Closes all the open bins, in the order they were opened
+		return [self._close(box) for box in range(len(self.slots)) if self.slots[box] is not None]
+
+	def _open_bin(self):
+		leaves = len(self.tree) // 2
+		if len(self.slots) == leaves:
+			if 2 * self.open_bins <= leaves:
+				self._compact()
+			else:
+				self.tree = grow_capacity_tree(self.tree, self.capacity)
+		self.slots.append([set(), 0.])
+		self.open_bins += 1
+		return len(self.slots) - 1
+
+	def _close(self, box):
+		items, load = self.slots[box]
+		self.slots[box] = None
+		self.open_bins -= 1
+		update_capacity_tree(self.tree, box, float('-inf'))
+		closed_bin = (items, load)
+		if self.callback is not None: self.callback(closed_bin)
+		return closed_bin
+
+	def _compact(self):
+	  # Rebuilds the tree with the open bins only, keeping their order
+		leaves = len(self.tree) // 2
+		kept = [box for box in range(leaves) if self.slots[box] is not None]
+		tree = capacity_tree(len(kept) + 1, self.capacity)
+		new_leaves = len(tree) // 2
+		for new_box, box in enumerate(kept):
+			tree[new_leaves + new_box] = self.tree[leaves + box]
+		for node in range(new_leaves - 1, 0, -1):
+			tree[node] = max(tree[2 * node], tree[2 * node + 1])
+		self.tree = tree
+		self.slots = [self.slots[box] for box in kept]
+		self.oldest = 0
+
 #------------------- AUTOMATED TESTING ROUTINE AND CHECK --------------------
 
 def automated_testing_routine(bpp_function):
@@ -122,8 +494,20 @@ def check_automated_testing_routine(bpp_function):
 		elif test == '1': return 'The first fit function has passed only the first test\nThe right solution for the second one was ([{0, 1, 4}, {2, 5}, {3}], 3)'
 		elif test == '2': return 'The first fit function has passed only the second test\nThe right solution for the first one was ([{0, 2}, {1}, {3}], 3)'
 		else: return 'The first fit function has failed all tests\nThe right solution for the first one was ([{0, 2}, {1}, {3}], 3)\nThe right solution for the second one was ([{0, 1, 4}, {2, 5}, {3}], 3)'
+	if bpp_function == branch_and_bound_packing:
+	  # The packing may differ from the brute force one, the number of bins
+	  # may not; the last instances have bins filled exactly up to the
+	  # capacity, where rounding errors can wrongly reject a packing.
+		test = ''
+		if automated_testing_routine(bpp_function)[0][1] == 2: test += '1'
+		if automated_testing_routine(bpp_function)[1][1] == 3: test += '2'
+		for n, weights, C in [(2, [0.8, 0.2], 1), (4, [0.8, 0.2, 0.8, 0.2], 1), (4, [0.3, 0.1, 0.3, 0.3], 1)]:
+			if bpp_function(n, weights, C)[1] == brute_force_packing(n, weights, C)[1]: test += '3'
+		if test == '12333': return 'The branch and bound function has passed all tests'
+		else: return 'The branch and bound function has failed some tests: it should need 2 and 3 bins for the automated instances and as many bins as brute_force_packing for the exact fits'
 # print(check_automated_testing_routine(brute_force_packing))
 # print(check_automated_testing_routine(first_fit))
+# print(check_automated_testing_routine(branch_and_bound_packing))
 
 #------------------- BENCHMARKING TESTING ROUTINE --------------------
 
@@ -141,18 +525,58 @@ def benchmarking_routine(bpp_function, n):
 def print_benchmarking_routine(items):
   # Given the list of the n instances for the number
   # of items, the function prints the solutions 
-  # produced by both the brute_force_packing and 
-  # the first_fit functions.
+  # produced by both the brute_force_packing (or, above 13
+  # items, branch_and_bound_packing) and the first_fit functions.
 	for n in items:
 		print('Number of items:',n)
 		if n <= 13: print('The BRUTE packing and the optimal number of bins are: ',benchmarking_routine(brute_force_packing, n))
-		else: print('The selected number of items is too high for the brute force solution')
+		else: print('The EXACT packing and the optimal number of bins are: ',benchmarking_routine(branch_and_bound_packing, n))
 		print('The GREEDY packing and the greedy number of bins are: ',end=' ')
 		print(benchmarking_routine(first_fit, n))
 
 items = [4, 6, 8, 10, 12, 14, 16, 18, 20]
 #print_benchmarking_routine(items)
 
+def random_instances(n, batch_size, capacity, generator):
+  # Given the number of items, the number of instances, the capacity and
+  # a numpy random Generator, the function returns a batch_size x n
+  # matrix of weights drawn uniformly in [0, 1), each row being an
+  # instance whose total weight exceeds the capacity (as required by
+  # benchmarking_routine). The rows that fail are redrawn all together.
+	weights = generator.uniform(0, 1, (batch_size, n))
+	rejected = weights.sum(axis=1) <= capacity
+	while rejected.any():
+		weights[rejected] = generator.uniform(0, 1, (int(rejected.sum()), n))
+		rejected = weights.sum(axis=1) <= capacity
+	return weights
+
+def batch_benchmarking_routine(bpp_function, n, batch_size=1000, seed=None):
+  # Given the Bin packing problem solving function, the number of items
+  # n, the number of instances and an optional seed, the function
+  # generates all the instances at once with random_instances() (same
+  # constraints of benchmarking_routine), times bpp_function on each of
+  # them with time.perf_counter() and returns a dictionary with the
+  # per-instance arrays (bins used, L1 lower bound ceil(sum/C), their
+  # ratio and wall time) and the statistics of the batch, among which
+  # the 50th, 95th and 99th percentiles of the wall time.
+	C = n**(1/2)
+	weights = random_instances(n, batch_size, C, numpy.random.default_rng(seed))
+	bins = numpy.empty(batch_size, dtype=int)
+	times = numpy.empty(batch_size)
+	for row in range(batch_size):
+		instance = weights[row].tolist()
+		start = time.perf_counter()
+		bins[row] = bpp_function(n, instance, C)[1]
+		times[row] = time.perf_counter() - start
+	lower_bounds = numpy.ceil(weights.sum(axis=1) / C - 1e-9)
+	ratios = bins / lower_bounds
+	time_p50, time_p95, time_p99 = numpy.percentile(times, [50, 95, 99])
+	return {'n': n, 'capacity': C, 'bins': bins, 'lower_bounds': lower_bounds,
+		'ratios': ratios, 'times': times, 'mean_bins': bins.mean(),
+		'mean_ratio': ratios.mean(), 'max_ratio': ratios.max(),
+		'time_p50': time_p50, 'time_p95': time_p95, 'time_p99': time_p99}
+# print(batch_benchmarking_routine(first_fit, 100, seed=0))
+
 def approximation_ratio_routine(n):
   # Given the number of items n, the function computes
   # the ratio between between the number of bins used 
@@ -190,6 +614,97 @@ def approximation_ratio_routine(n):
 # G 3 SUB-OPTIMAL
 # Approximation ratio:  1.5
 
+#------------------- PARALLEL APPROXIMATION RATIO STUDY --------------------
+
+# One result per trial: n, seed, exact bins, greedy bins, ratio (22 bytes)
+result_record = struct.Struct('<HQHHd')
+result_dtype = numpy.dtype([('n', '<u2'), ('seed', '<u8'), ('exact', '<u2'), ('greedy', '<u2'), ('ratio', '<f8')])
+
+def trial_seed(base_seed, n, trial):
+  # Returns the seed of a single trial: numpy's SeedSequence mixes the
+  # three numbers, so every (n, trial) gets an independent stream that
+  # can be regenerated from the base seed alone.
+	return int(numpy.random.SeedSequence([base_seed, n, trial]).generate_state(1, numpy.uint64)[0])
+
+def approximation_ratio_trial(n, seed, exact_function='brute_force_packing'):
+  # Given the number of items, the seed and the name of the exact
+  # solver, the function draws the same kind of instance used by
+  # approximation_ratio_routine (C = 1) from random.Random(seed) and
+  # returns (n, seed, exact bins, greedy bins, ratio, weights).
+	generator = random.Random(seed)
+	C = 1
+	weights = [generator.uniform(0,1) for i in range(n)]
+	while sum(weights) <= C:
+		weights = [generator.uniform(0,1) for i in range(n)]
+	exact_bins = globals()[exact_function](n, weights, C)[1]
+	greedy_bins = first_fit(n, weights, C)[1]
+	return n, seed, exact_bins, greedy_bins, greedy_bins/exact_bins, weights
+
+def approximation_ratio_study(sizes, trials, output_file, base_seed=0, workers=None,
+		batch=10000, exact_function='brute_force_packing', witnesses=10):
+  # Given the list of numbers of items, the number of trials for each of
+  # them and the name of the output file, the function runs
+  # approximation_ratio_trial() on a pool of processes (workers defaults
+  # to the number of cores), "batch" trials at a time.
+  # Each result is appended to output_file as a result_record (it can be
+  # loaded with read_approximation_ratio_results()), while the
+  # "witnesses" instances with the highest ratio are kept with their
+  # weights. After every batch the file is flushed and a checkpoint
+  # (output_file + '.checkpoint', JSON) records the trials done, the
+  # size of the file and the witnesses: if the study is interrupted,
+  # calling it again with the same arguments resumes from there,
+  # dropping any record written after the checkpoint. The checkpoint also
+  # records the arguments that change the results: ValueError is raised
+  # instead of resuming with different ones, or when the output file is
+  # missing or shorter than the checkpoint says, so that two studies are
+  # never mixed in the same file.
+  # The function returns the witnesses, worst first.
+	checkpoint_file = output_file + '.checkpoint'
+	arguments = {'trials': trials, 'base_seed': base_seed, 'exact_function': exact_function, 'witnesses': witnesses}
+	if os.path.exists(checkpoint_file):
+		with open(checkpoint_file) as file:
+			checkpoint = json.load(file)
+		if checkpoint.get('arguments') != arguments:
+			raise ValueError('The checkpoint ' + checkpoint_file + ' belongs to a study with other arguments: ' + str(checkpoint.get('arguments')))
+		if not os.path.exists(output_file) or os.path.getsize(output_file) < checkpoint['offset']:
+			raise ValueError('The output file ' + output_file + ' is shorter than its checkpoint ' + checkpoint_file)
+	else:
+		checkpoint = {'arguments': arguments, 'done': {}, 'offset': 0, 'worst': []}
+	with open(output_file, 'ab') as file:
+		file.truncate(checkpoint['offset'])
+	with ProcessPoolExecutor(max_workers=workers) as pool, open(output_file, 'ab') as file:
+		for n in sizes:
+			done = checkpoint['done'].get(str(n), 0)
+			while done < trials:
+				end = min(done + batch, trials)
+				seeds = [trial_seed(base_seed, n, trial) for trial in range(done, end)]
+				results = pool.map(approximation_ratio_trial, itertools.repeat(n), seeds,
+					itertools.repeat(exact_function), chunksize=max(1, len(seeds) // 64))
+				for n_items, seed, exact_bins, greedy_bins, ratio, weights in results:
+					file.write(result_record.pack(n_items, seed, exact_bins, greedy_bins, ratio))
+					if len(checkpoint['worst']) < witnesses or ratio > checkpoint['worst'][-1]['ratio']:
+						checkpoint['worst'].append({'n': n_items, 'seed': seed, 'exact': exact_bins,
+							'greedy': greedy_bins, 'ratio': ratio, 'weights': weights})
+						checkpoint['worst'].sort(key=lambda witness: -witness['ratio'])
+						del checkpoint['worst'][witnesses:]
+				file.flush()
+				os.fsync(file.fileno())
+				done = end
+				checkpoint['done'][str(n)] = done
+				checkpoint['offset'] = file.tell()
+				with open(checkpoint_file + '.tmp', 'w') as temporary:
+					json.dump(checkpoint, temporary)
+				os.replace(checkpoint_file + '.tmp', checkpoint_file)
+	return checkpoint['worst']
+
+def read_approximation_ratio_results(output_file):
+  # Returns the results written by approximation_ratio_study() as a
+  # numpy structured array with the fields of result_dtype.
+	return numpy.fromfile(output_file, dtype=result_dtype)
+
+# worst = approximation_ratio_study([4, 6, 8, 10], 10**6, 'ratios.bin')
+# results = read_approximation_ratio_results('ratios.bin')
+
 #------------------- TIMEIT ANALYSIS AND COORDINATES --------------------
 
 def runtime(bpp_function, n):
@@ -1,4 +1,6 @@
-import sys
+import sys, os, itertools, mmap, hashlib, contextlib, numpy
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
 # If you want to run the code with on a specific text file,
 # use the following syntax: $ python3 MONICA_NICOLAU.py inputfile.txt
 
@@ -7,6 +9,18 @@ genomic_alphabet = 'ATCG'
 # For prokaryotic genomes, gene transcripts, RNA sequences use the following alphabet:
 # alphabet_with_uracile = 'AUGC'  
 
+# Optional instrumentation (see instrumentation.py in the main folder):
+# when monitor is not None, the searches count the patterns they evaluate
+# and the k-mers compared with them, time their phases and report their
+# progress to it. Left to None it costs one check per step.
+monitor = None
+
+def timed_phase(name):
+
+  # Times a phase of a search when the monitor is on
+
+    return monitor.phase(name) if monitor is not None else contextlib.nullcontext()
+
 
 def read_instance(file_name, alphabet):
 
@@ -26,6 +40,83 @@ def read_instance(file_name, alphabet):
 
     return (pattern_length, max_distance, string)
 
+def read_packed_instance(file_name, alphabet, pattern_length=None, max_distance=None, chunk_size=1 << 24):
+
+  # Given a text file and the proper alphabet, the function returns the
+  # pattern length, the maximum Hamming distance and the genome as a
+  # PackedGenome, without ever holding the whole sequence as a string:
+  # the file is memory-mapped and the sequence bytes are validated and
+  # 2-bit encoded chunk_size bytes at a time (with lookup tables on numpy
+  # views of the map, so the only copies are chunk-sized).
+  # Two formats are accepted:
+  # - the three-line format of read_instance (pattern length, maximum
+  #   distance and genome), the arguments overriding the first two lines;
+  # - FASTA: '>' header lines followed by the sequence wrapped on any
+  #   number of lines, in which case pattern_length and max_distance must
+  #   be given. Lowercase nucleotides are accepted; the sequences of
+  #   several records (e.g. chromosomes) are packed one after the other,
+  #   but the PackedGenome keeps where each record starts and no k-mer
+  #   spanning two records is ever counted.
+  # As in read_instance, ValueError is raised for non-positive values or
+  # characters outside the alphabet (e.g. 'N').
+
+    with open(file_name, "rb") as file:
+      # The map is released with the last numpy view of it
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = numpy.frombuffer(data, dtype=numpy.uint8)
+        start = 0
+        while start < len(data) and data[start:start + 1].isspace(): start += 1
+        regions = []  # (start, end) of the bytes holding the sequence
+        if data[start:start + 1] == b'>':
+            fasta = True
+            while start < len(data):
+                header_end = data.find(b'\n', start)
+                if header_end == -1: break
+                next_header = data.find(b'\n>', header_end)
+                end = len(data) if next_header == -1 else next_header + 1
+                regions.append((header_end + 1, end))
+                start = end
+        else:
+            fasta = False
+            first_line_end = data.find(b'\n')
+            second_line_end = data.find(b'\n', first_line_end + 1)
+            if first_line_end == -1 or second_line_end == -1: raise ValueError
+            if pattern_length is None: pattern_length = int(data[:first_line_end])
+            if max_distance is None: max_distance = int(data[first_line_end + 1:second_line_end])
+            third_line_end = data.find(b'\n', second_line_end + 1)
+            regions.append((second_line_end + 1, len(data) if third_line_end == -1 else third_line_end))
+
+        if pattern_length is None or max_distance is None: raise ValueError
+        if pattern_length <= 0 or max_distance <= 0: raise ValueError
+
+        table = numpy.full(256, 255, dtype=numpy.uint8)  # 255: invalid byte
+        for byte in b' \t\r\n': table[byte] = 254  # 254: byte to be skipped
+        for digit, character in enumerate(alphabet):
+            table[ord(character)] = digit
+            if fasta: table[ord(character.lower())] = digit
+
+        packed = numpy.zeros(-(-sum(end - begin for begin, end in regions) // 4), dtype=numpy.uint8)
+        length = 0
+        carry = numpy.zeros(0, dtype=numpy.uint8)  # digits left over by the previous chunk
+        record_starts = []
+        for begin, end in regions:
+            record_starts.append(length + len(carry))
+            for chunk_start in range(begin, end, chunk_size):
+                codes = table[view[chunk_start : min(end, chunk_start + chunk_size)]]
+                if (codes == 255).any(): raise ValueError
+                digits = numpy.concatenate((carry, codes[codes != 254]))
+                usable = len(digits) // 4 * 4
+                quadruples = digits[:usable].reshape(-1, 4)
+                packed[length // 4 : (length + usable) // 4] = (quadruples[:, 0] << 6) | (quadruples[:, 1] << 4) | (quadruples[:, 2] << 2) | quadruples[:, 3]
+                length += usable
+                carry = digits[usable:]
+        for position, digit in enumerate(carry):
+            packed[length // 4] |= digit << (6 - 2 * position)
+        length += len(carry)
+
+    record_starts = sorted({start for start in record_starts if 0 < start < length})
+    return (pattern_length, max_distance, PackedGenome(packed[:-(-length // 4)], length, alphabet, record_starts))
+
 def check_hamming_distance(string1, string2, allowed_distance):
 
   # Given two strings of the same length and the allowed Hamming 
@@ -41,6 +132,222 @@ def check_hamming_distance(string1, string2, allowed_distance):
                 return False
     return True
 
+def edit_distance_occurrences(pattern, genome, allowed_distance):
+
+  # Given a pattern, a genome string and the allowed edit (Levenshtein)
+  # distance, the function returns the number of positions of the genome
+  # where a substring within the allowed distance from the pattern ends.
+  # It follows Myers' bit-parallel algorithm: a column of the dynamic
+  # programming table is kept as the bits of its vertical differences
+  # (+1 in plus_vertical, -1 in minus_vertical, one bit per character of
+  # the pattern) and updated with a few bitwise operations per character
+  # of the genome, while score tracks its last cell.
+
+    pattern_length = len(pattern)
+    if pattern_length == 0: return len(genome) + 1
+    all_ones, last_bit = (1 << pattern_length) - 1, 1 << (pattern_length - 1)
+    matches = dict()  # bits of the pattern equal to each character
+    for position, character in enumerate(pattern):
+        matches[character] = matches.get(character, 0) | 1 << position
+    plus_vertical, minus_vertical, score = all_ones, 0, pattern_length
+    approximate_occurrences = 0
+    for character in genome:
+        equal = matches.get(character, 0)
+        vertical = equal | minus_vertical
+        horizontal = (((equal & plus_vertical) + plus_vertical) ^ plus_vertical) | equal
+        plus_horizontal = (minus_vertical | ~(horizontal | plus_vertical)) & all_ones
+        minus_horizontal = plus_vertical & horizontal
+        if plus_horizontal & last_bit: score += 1
+        elif minus_horizontal & last_bit: score -= 1
+        plus_horizontal, minus_horizontal = (plus_horizontal << 1) & all_ones, (minus_horizontal << 1) & all_ones
+        plus_vertical = (minus_horizontal | ~(vertical | plus_horizontal)) & all_ones
+        minus_vertical = plus_horizontal & vertical
+        if score <= allowed_distance: approximate_occurrences += 1
+    return approximate_occurrences
+
+
+# Number of k-mers handled at once when a genome is streamed in windows
+window_size = 1 << 22
+# Number of set bits of every byte, used by popcount when numpy has no bitwise_count
+byte_popcount = numpy.array([bin(byte).count('1') for byte in range(256)], dtype=numpy.uint8)
+# Selects the low bit of every 2-bit digit of a 64-bit code
+low_bits = numpy.uint64(0x5555555555555555)
+
+def popcount(values):
+
+  # Given a numpy array of unsigned 64-bit integers, the function
+  # returns the number of set bits of each of them.
+
+    if hasattr(numpy, 'bitwise_count'):
+        return numpy.bitwise_count(values)
+    return byte_popcount[values.view(numpy.uint8)].reshape(values.shape + (8,)).sum(axis=-1)
+
+def genome_digits(genome, alphabet):
+
+  # Given the genome string and an alphabet of four characters, the
+  # function returns a numpy array with the index in the alphabet (a
+  # 2-bit digit) of every character, translating the whole string at
+  # once with a 256-entry lookup table. It raises ValueError if a
+  # character does not belong to the alphabet, as read_instance does.
+
+    if len(alphabet) != 4: raise ValueError
+    table = numpy.full(256, 255, dtype=numpy.uint8)
+    for digit, character in enumerate(alphabet):
+        table[ord(character)] = digit
+    digits = table[numpy.frombuffer(genome.encode('ascii'), dtype=numpy.uint8)]
+    if (digits == 255).any(): raise ValueError
+    return digits
+
+def k_mer_codes(digits, pattern_length):
+
+  # Given the array of 2-bit digits of a genome and the pattern length
+  # (at most 32), the function returns the numpy uint64 array whose
+  # i-th element is the code (see encode_pattern) of the k-mer starting
+  # at position i. The codes are rolled one digit at a time for all the
+  # positions together.
+
+    if pattern_length > 32: raise ValueError
+    number_of_k_mers = max(len(digits) - pattern_length + 1, 0)
+    codes = numpy.zeros(number_of_k_mers, dtype=numpy.uint64)
+    for offset in range(pattern_length):
+        codes <<= numpy.uint64(2)
+        codes |= digits[offset : offset + number_of_k_mers]
+    return codes
+
+def hamming_distances(pattern_code, codes):
+
+  # Given the code of a pattern and the array of k-mer codes, the
+  # function returns the Hamming distance between the pattern and every
+  # k-mer: XOR leaves a non-zero 2-bit digit where the characters
+  # differ, folding the high bit of each digit onto the low one and
+  # keeping only the low bits leaves one bit per mismatch, which are
+  # then counted with popcount.
+
+    difference = codes ^ numpy.uint64(pattern_code)
+    return popcount((difference | (difference >> numpy.uint64(1))) & low_bits)
+
+class PackedGenome:
+
+  # A genome stored with 2 bits per nucleotide: four nucleotides per
+  # byte of a numpy uint8 buffer, the first one in the most significant
+  # bits, so it takes a quarter of the memory of the string. The k-mer
+  # codes of each pattern length are computed once and kept, because
+  # count_approximate_occurrences needs them for every pattern.
+  # A genome made of several records (see read_packed_instance) keeps
+  # the positions where the records after the first one start, and the
+  # k-mers spanning two records are left out by k_mer_mask.
+
+    def __init__(self, packed, length, alphabet, record_starts=()):
+        self.packed = packed
+        self.length = length
+        self.alphabet = alphabet
+        self.record_starts = numpy.array(record_starts, dtype=numpy.int64)
+        self.k_mer_cache = dict()
+        self.mask_cache = dict()
+        self.record_k_mer_cache = dict()  # k_mer_codes without the k-mers spanning two records
+        self.digest = None
+
+    @classmethod
+    def from_string(cls, genome, alphabet):
+        digits = genome_digits(genome, alphabet)
+        padded = numpy.zeros(-(-len(digits) // 4) * 4, dtype=numpy.uint8)
+        padded[:len(digits)] = digits
+        quadruples = padded.reshape(-1, 4)
+        packed = (quadruples[:, 0] << 6) | (quadruples[:, 1] << 4) | (quadruples[:, 2] << 2) | quadruples[:, 3]
+        return cls(packed, len(digits), alphabet)
+
+    def __len__(self):
+        return self.length
+
+    def digits(self, start=0, stop=None):
+
+      # Unpacks the 2-bit digits of the nucleotides in [start, stop)
+
+        if stop is None or stop > self.length: stop = self.length
+        if start >= stop: return numpy.zeros(0, dtype=numpy.uint8)
+        chunk = self.packed[start // 4 : -(-stop // 4)]
+        unpacked = (chunk[:, None] >> numpy.array([6, 4, 2, 0], dtype=numpy.uint8)) & 3
+        return unpacked.ravel()[start % 4 : start % 4 + stop - start]
+
+    def fingerprint(self):
+
+      # The sha256 digest of the packed nucleotides, the length and the
+      # record starts, which
+      # identifies the content of the genome (see cached_k_mer_histogram)
+
+        if self.digest is None:
+            digest = hashlib.sha256(numpy.ascontiguousarray(self.packed).tobytes())
+            digest.update(str(self.length).encode())
+            digest.update(self.record_starts.tobytes())
+            self.digest = digest.hexdigest()
+        return self.digest
+
+    def k_mer_codes(self, pattern_length):
+        if pattern_length not in self.k_mer_cache:
+            self.k_mer_cache[pattern_length] = k_mer_codes(self.digits(), pattern_length)
+        return self.k_mer_cache[pattern_length]
+
+    def records(self):
+
+      # The (start, stop) positions of every record
+
+        bounds = [0] + self.record_starts.tolist() + [self.length]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def k_mer_mask(self, pattern_length, start=0, stop=None):
+
+      # Boolean array telling which k-mers starting in [start, stop) (by
+      # default all of them) lie within a single record: only the
+      # pattern_length - 1 positions before each record start are
+      # cleared, so it takes one byte per k-mer.
+
+        whole = start == 0 and stop is None
+        if whole and pattern_length in self.mask_cache: return self.mask_cache[pattern_length]
+        if stop is None: stop = self.length - pattern_length + 1
+        mask = numpy.ones(max(stop - start, 0), dtype=bool)
+        boundaries = self.record_starts[(self.record_starts > start) & (self.record_starts < stop + pattern_length - 1)]
+        for offset in range(1, pattern_length):
+            spanning = boundaries - offset
+            spanning = spanning[(spanning >= start) & (spanning < stop)]
+            mask[spanning - start] = False
+        mask[max(self.length - pattern_length + 1 - start, 0):] = False
+        if whole: self.mask_cache[pattern_length] = mask
+        return mask
+
+    def windows(self, pattern_length, size=window_size):
+
+      # Yields (start, digits) for consecutive windows of the genome, each
+      # one holding the "size" k-mers starting from position start: the
+      # windows overlap by pattern_length - 1 nucleotides, so every k-mer
+      # belongs to exactly one of them and memory stays bounded.
+
+        for start in range(0, self.length - pattern_length + 1, size):
+            yield start, self.digits(start, start + size + pattern_length - 1)
+
+    def k_mer_windows(self, pattern_length, size=window_size):
+
+      # Yields the k-mer codes window by window (a single, cached array
+      # when the genome fits in one window), without the ones spanning
+      # two records.
+
+        if self.length <= size:
+            if len(self.record_starts) == 0:
+                yield self.k_mer_codes(pattern_length)
+            else:
+                if pattern_length not in self.record_k_mer_cache:
+                    self.record_k_mer_cache[pattern_length] = self.k_mer_codes(pattern_length)[self.k_mer_mask(pattern_length)]
+                yield self.record_k_mer_cache[pattern_length]
+        else:
+            for start, digits in self.windows(pattern_length, size):
+                codes = k_mer_codes(digits, pattern_length)
+                if len(self.record_starts) > 0: codes = codes[self.k_mer_mask(pattern_length, start, start + len(codes))]
+                yield codes
+
+    def record_strings(self):
+
+      # The sequence of every record as a string
+
+        return [''.join(self.alphabet[digit] for digit in self.digits(start, stop)) for start, stop in self.records()]
 
 def patterns_generator(pattern_length, alphabet):  # wrapper function
 
@@ -77,11 +384,37 @@ def patterns_generator(pattern_length, alphabet):  # wrapper function
 
     yield from sub_patterns_generator()
 
-def count_approximate_occurrences(pattern, genome, maximum_distance):
-
-  # Given a single pattern, the genome string and the allowed
-  # Hamming distance, the function return the number of approximate
-  # occurrences of the input pattern in the genome string.
+def count_approximate_occurrences(pattern, genome, maximum_distance, alphabet=genomic_alphabet, distance='hamming'):
+
+  # Given a single pattern, the genome (a string or a PackedGenome) and
+  # the allowed Hamming distance, the function return the number of
+  # approximate occurrences of the input pattern in the genome string.
+  # The pattern is compared with all the k-mers at once by
+  # hamming_distances; patterns longer than 32 characters and strings
+  # with characters outside the alphabet are compared character by
+  # character. With distance='edit' insertions and deletions are allowed
+  # too, and the occurrences are counted by their end positions (see
+  # edit_distance_occurrences).
+
+    if distance == 'edit':
+        if isinstance(genome, PackedGenome):
+            return sum(edit_distance_occurrences(pattern, record, maximum_distance) for record in genome.record_strings())
+        return edit_distance_occurrences(pattern, genome, maximum_distance)
+    if distance != 'hamming': raise ValueError
+    if len(pattern) <= 32:
+        try:
+            if isinstance(genome, str): genome = PackedGenome.from_string(genome, alphabet)
+            pattern_code = encode_pattern(pattern, genome.alphabet)
+        except ValueError:
+            pass
+        else:
+            approximate_occurrences = 0
+            for codes in genome.k_mer_windows(len(pattern)):
+                if monitor is not None: monitor.count('hamming_comparisons', len(codes))
+                approximate_occurrences += int(numpy.count_nonzero(hamming_distances(pattern_code, codes) <= maximum_distance))
+            return approximate_occurrences
+    if isinstance(genome, PackedGenome):
+        return sum(count_approximate_occurrences(pattern, record, maximum_distance, alphabet) for record in genome.record_strings())
 
     approximate_occurrences = 0  # initialization of the number of approximate occurrences
     pattern_length = len(pattern)
@@ -89,6 +422,7 @@ def count_approximate_occurrences(pattern, genome, maximum_distance):
     for index in range(len(genome) - pattern_length + 1):
       # Creates one k-mer of the genome string at the time. 
         k_mer = genome[index : index + pattern_length]
+        if monitor is not None: monitor.count('hamming_comparisons')
 
         if check_hamming_distance(pattern, k_mer, maximum_distance):
           # Checks if the distance between the input pattern and the
@@ -99,7 +433,342 @@ def count_approximate_occurrences(pattern, genome, maximum_distance):
 
     return approximate_occurrences
 
-def find_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet):
+def encode_pattern(pattern, alphabet):
+
+  # Given a pattern and an alphabet of four characters, the function
+  # returns the integer that stores the pattern with 2 bits per
+  # character (the index of the character in the alphabet), the first
+  # character in the most significant bits. In this way the codes follow
+  # the order in which patterns_generator yields the patterns.
+
+    code = 0
+    for character in pattern:
+        code = (code << 2) | alphabet.index(character)
+    return code
+
+def decode_pattern(code, pattern_length, alphabet):
+
+  # Inverse of encode_pattern: given the code, the pattern length and
+  # the alphabet, the function returns the pattern string.
+
+    return ''.join(alphabet[(code >> 2 * (pattern_length - 1 - position)) & 3] for position in range(pattern_length))
+
+def neighborhood_masks(pattern_length, maximum_distance):
+
+  # Given the pattern length and the maximum Hamming distance, the
+  # function returns the list of the integers having at most
+  # maximum_distance non-zero 2-bit digits. XOR-ing a pattern code with
+  # one of them replaces the characters at the non-zero digits with
+  # different ones, so the codes of the patterns within maximum_distance
+  # from a k-mer are exactly its code XOR each mask, without repetitions.
+
+    masks = []
+    for distance in range(min(maximum_distance, pattern_length) + 1):
+        for positions in itertools.combinations(range(pattern_length), distance):
+            for digits in itertools.product((1, 2, 3), repeat=distance):
+                mask = 0
+                for position, digit in zip(positions, digits):
+                    mask |= digit << 2 * (pattern_length - 1 - position)
+                masks.append(mask)
+    return masks
+
+def k_mer_histogram(genome, pattern_length, start=0, stop=None):
+
+  # Given a PackedGenome and the pattern length, the function returns a
+  # dense numpy array with the number of exact occurrences of each k-mer
+  # code, counting the k-mers that start in [start, stop) (by default
+  # the whole genome) one window at a time, except the ones spanning two
+  # records.
+
+    if stop is None: stop = len(genome) - pattern_length + 1
+    histogram = numpy.zeros(1 << 2 * pattern_length, dtype=numpy.int64)
+    for window_start in range(start, stop, window_size):
+        window_stop = min(stop, window_start + window_size)
+        codes = k_mer_codes(genome.digits(window_start, window_stop + pattern_length - 1), pattern_length)
+        if len(genome.record_starts) > 0: codes = codes[genome.k_mer_mask(pattern_length, window_start, window_stop)]
+        window_k_mers, window_occurrences = numpy.unique(codes, return_counts=True)
+        histogram[window_k_mers] += window_occurrences
+    return histogram
+
+def neighborhood_counts(histogram, pattern_length, maximum_distance):
+
+  # Given the k_mer_histogram, the function returns the dense array of
+  # the approximate occurrences of every pattern: each distinct k-mer
+  # adds its number of occurrences to every pattern of its Hamming
+  # neighborhood (neighborhood_masks). For a given mask the codes
+  # k-mer XOR mask are all different, so one vectorized addition per
+  # mask is enough.
+
+    k_mers = numpy.flatnonzero(histogram)
+    occurrences = histogram[k_mers]
+    counts = numpy.zeros(1 << 2 * pattern_length, dtype=numpy.int64)
+    for mask in neighborhood_masks(pattern_length, maximum_distance):
+        counts[k_mers ^ mask] += occurrences
+    return counts
+
+def most_frequent_pattern(counts, pattern_length, alphabet):
+
+  # Given the dense array of the approximate occurrences of every
+  # pattern, returns the first pattern (in the order of
+  # patterns_generator) with the highest count, as find_recurrent_pattern
+  # does, and raises ValueError when no pattern occurs at all.
+
+    best = int(numpy.argmax(counts))  # the first one among the maxima
+    if counts[best] == 0: raise ValueError  # no k-mer at all, as in find_recurrent_pattern
+    return decode_pattern(best, pattern_length, alphabet)
+
+def neighborhood_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet):
+
+  # Same input and output of find_recurrent_pattern, but instead of
+  # comparing each of the 4^m patterns with every k-mer, the genome is
+  # scanned once (window by window) to count its k-mers, and the counts
+  # are spread over their Hamming neighborhoods (neighborhood_counts).
+  # The work is proportional to n times the size of the neighborhood
+  # instead of 4^m times n.
+
+    if isinstance(genome, str): genome = PackedGenome.from_string(genome, alphabet)
+    with timed_phase('histogram'):
+        histogram = k_mer_histogram(genome, pattern_length)
+    with timed_phase('neighborhoods'):
+        counts = neighborhood_counts(histogram, pattern_length, maximum_distance)
+    if monitor is not None: monitor.count('patterns_evaluated', len(counts))
+    return most_frequent_pattern(counts, pattern_length, alphabet)
+
+def branch_and_bound_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet):
+
+  # Same input and output of find_recurrent_pattern, but the patterns
+  # are built one nucleotide at a time as in patterns_generator, walking
+  # the trie of their prefixes depth-first. Every prefix keeps the
+  # positions of the k-mers whose first characters are still within
+  # maximum_distance from it, together with their number of mismatches;
+  # a child inherits them and drops the ones that exceed the distance
+  # with the new nucleotide (one vectorized comparison). Since the count
+  # of surviving positions can only decrease along a branch, it is an
+  # upper bound on the occurrences of any completion: a prefix whose
+  # bound does not beat the best pattern found so far is cut off with
+  # its whole subtree. The visit follows the order of patterns_generator
+  # and only strictly better patterns are kept, so the first pattern with
+  # the highest count is returned, as find_recurrent_pattern does.
+  # The search starts from the count of the most frequent exact k-mer of
+  # the first window (see PackedGenome.k_mer_windows), which some pattern
+  # certainly reaches, so that only the subtrees that cannot even match
+  # it are cut before the first leaf; the last nucleotide is chosen for
+  # the four children at once.
+  # Unlike the windowed engines, this one holds the whole genome in
+  # memory: its unpacked digits (one byte per nucleotide) and, for every
+  # prefix on the current branch, the surviving positions (4 bytes each
+  # when the genome is shorter than 2^32) and mismatches (1 byte), so
+  # the first levels, where almost every k-mer survives, take about
+  # 5 bytes per nucleotide each.
+
+    if isinstance(genome, str): genome = PackedGenome.from_string(genome, alphabet)
+    digits = genome.digits()
+    position_type = numpy.uint32 if len(genome) < 1 << 32 else numpy.int64
+    if len(genome.record_starts) == 0:
+        k_mer_positions = numpy.arange(max(len(genome) - pattern_length + 1, 0), dtype=position_type)
+    else:
+        k_mer_positions = numpy.flatnonzero(genome.k_mer_mask(pattern_length)).astype(position_type)
+    if len(k_mer_positions) == 0: raise ValueError  # no k-mer at all, as in find_recurrent_pattern
+    best_number_of_occurrences, best_code = 0, None
+    if pattern_length <= 32:
+        seed, matches = None, 0
+        for codes in genome.k_mer_windows(pattern_length):
+            if seed is None and len(codes) > 0:
+                window_k_mers, window_occurrences = numpy.unique(codes, return_counts=True)
+                seed = int(window_k_mers[numpy.argmax(window_occurrences)])
+            if seed is not None:
+                matches += int(numpy.count_nonzero(hamming_distances(seed, codes) <= maximum_distance))
+        best_number_of_occurrences = matches - 1
+
+    def visit(depth, code, positions, mismatches):
+        nonlocal best_number_of_occurrences, best_code
+        if len(positions) <= best_number_of_occurrences:
+            if monitor is not None: monitor.count('prefixes_pruned')
+            return
+        if monitor is not None: monitor.count('prefixes_visited')
+        column = digits[depth:][positions]
+        if depth == pattern_length - 1:
+            if monitor is not None: monitor.count('patterns_evaluated', 4)
+            within = int(numpy.count_nonzero(mismatches < maximum_distance))
+            at_limit = numpy.bincount(column[mismatches == maximum_distance], minlength=4)
+            for digit in range(4):
+                if within + int(at_limit[digit]) > best_number_of_occurrences:
+                    best_number_of_occurrences, best_code = within + int(at_limit[digit]), (code << 2) | digit
+            return
+        for digit in range(4):
+            child_mismatches = mismatches + (column != digit)
+            survivors = child_mismatches <= maximum_distance
+            visit(depth + 1, (code << 2) | digit, positions[survivors], child_mismatches[survivors])
+
+    # the mismatches never exceed maximum_distance + 1
+    mismatches = numpy.zeros(len(k_mer_positions), dtype=numpy.uint8 if maximum_distance < 255 else numpy.int64)
+    visit(0, 0, k_mer_positions, mismatches)
+    return decode_pattern(best_code, pattern_length, alphabet)
+
+def prefix_counts(genome, pattern_length, maximum_distance, prefix, prefix_length):
+
+  # Given a PackedGenome, the pattern length, the maximum distance and a
+  # prefix (the code of its first prefix_length characters), the function
+  # returns the approximate occurrences of all the patterns starting with
+  # that prefix, in the order of patterns_generator.
+
+    suffix_length = pattern_length - prefix_length
+    counts = numpy.zeros(1 << 2 * suffix_length, dtype=numpy.int64)
+    for suffix in range(len(counts)):
+        pattern_code = (prefix << 2 * suffix_length) | suffix
+        for codes in genome.k_mer_windows(pattern_length):
+            counts[suffix] += numpy.count_nonzero(hamming_distances(pattern_code, codes) <= maximum_distance)
+    return counts
+
+def segment_histogram(genome, pattern_length, start, stop):
+
+  # Sparse k_mer_histogram: given a PackedGenome, the pattern length and
+  # a segment of k-mer positions, returns the sorted array of the
+  # distinct codes of the k-mers starting in [start, stop) and the array
+  # of their occurrences, so its size does not depend on 4^m.
+
+    codes, occurrences = [numpy.zeros(0, dtype=numpy.uint64)], [numpy.zeros(0, dtype=numpy.int64)]
+    for window_start in range(start, stop, window_size):
+        window_stop = min(stop, window_start + window_size)
+        window_codes = k_mer_codes(genome.digits(window_start, window_stop + pattern_length - 1), pattern_length)
+        if len(genome.record_starts) > 0: window_codes = window_codes[genome.k_mer_mask(pattern_length, window_start, window_stop)]
+        window_k_mers, window_occurrences = numpy.unique(window_codes, return_counts=True)
+        codes.append(window_k_mers)
+        occurrences.append(window_occurrences)
+    codes, occurrences = numpy.concatenate(codes), numpy.concatenate(occurrences)
+    if len(codes) == 0: return codes, occurrences
+    order = numpy.argsort(codes, kind='stable')
+    codes, occurrences = codes[order], occurrences[order]
+    firsts = numpy.flatnonzero(numpy.concatenate(([True], codes[1:] != codes[:-1])))
+    return codes[firsts], numpy.add.reduceat(occurrences, firsts)
+
+def run_on_shared_genome(shared_name, length, alphabet, record_starts, task, *arguments):
+
+  # Runs in the worker processes of parallel_recurrent_pattern: attaches
+  # to the shared memory block holding the packed genome, wraps it in a
+  # PackedGenome without copying it and returns task(genome, *arguments).
+
+    memory = shared_memory.SharedMemory(name=shared_name)
+    genome = PackedGenome(numpy.ndarray((-(-length // 4),), dtype=numpy.uint8, buffer=memory.buf), length, alphabet, record_starts)
+    try:
+        return task(genome, *arguments)
+    finally:
+        del genome  # the buffer must not be referenced when it is closed
+        memory.close()
+
+def parallel_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet, workers=None, strategy='prefix'):
+
+  # Same input and output of find_recurrent_pattern, with the work shared
+  # by a pool of processes (workers defaults to the number of cores).
+  # The packed genome is copied once in a shared memory block that the
+  # workers attach to (run_on_shared_genome), instead of being pickled
+  # for each of them. With at least four tasks per worker, the strategy
+  # can be:
+  # - 'prefix': the patterns are split by their first characters, every
+  #   task counts the patterns with one prefix (prefix_counts) and their
+  #   counts are concatenated in the order of patterns_generator;
+  # - 'segment': the k-mers are split in segments of the genome (the
+  #   nucleotides overlap by pattern_length - 1), every task returns the
+  #   sparse histogram of its segment (segment_histogram), which is
+  #   added to the whole one as soon as it arrives, and the counts are
+  #   spread over the neighborhoods once (neighborhood_counts). Only one
+  #   dense array of 4^m counts is alive at a time, however many the
+  #   workers are, as in neighborhood_recurrent_pattern.
+  # Either way the merged counts are the ones of the serial engines, and
+  # so is the selected pattern.
+
+    if isinstance(genome, str): genome = PackedGenome.from_string(genome, alphabet)
+    workers = workers or os.cpu_count() or 1
+    memory = shared_memory.SharedMemory(create=True, size=max(genome.packed.nbytes, 1))
+    try:
+        numpy.ndarray(genome.packed.shape, dtype=numpy.uint8, buffer=memory.buf)[:] = genome.packed
+        shared = (memory.name, len(genome), alphabet, genome.record_starts.tolist())
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            if strategy == 'prefix':
+                prefix_length = 0
+                while 4**prefix_length < 4 * workers and prefix_length < pattern_length: prefix_length += 1
+                tasks = [pool.submit(run_on_shared_genome, *shared, prefix_counts, pattern_length, maximum_distance, prefix, prefix_length)
+                    for prefix in range(4**prefix_length)]
+                counts = numpy.concatenate([task.result() for task in tasks])
+            elif strategy == 'segment':
+                number_of_k_mers = max(len(genome) - pattern_length + 1, 0)
+                bounds = numpy.linspace(0, number_of_k_mers, 4 * workers + 1).astype(int)
+                # as_completed forgets each task once it is returned, so its result can be freed
+                tasks = as_completed([pool.submit(run_on_shared_genome, *shared, segment_histogram, pattern_length, int(start), int(stop))
+                    for start, stop in zip(bounds[:-1], bounds[1:]) if start < stop])
+                histogram = numpy.zeros(1 << 2 * pattern_length, dtype=numpy.int64)
+                for task in tasks:
+                    codes, occurrences = task.result()
+                    histogram[codes] += occurrences
+                counts = neighborhood_counts(histogram, pattern_length, maximum_distance)
+            else:
+                raise ValueError
+    finally:
+        memory.close()
+        memory.unlink()
+    return most_frequent_pattern(counts, pattern_length, alphabet)
+
+def edit_distance_counts(pattern_codes, pattern_length, digits, maximum_distance):
+
+  # Vectorized edit_distance_occurrences: given a numpy array of pattern
+  # codes (see encode_pattern), their length (at most 32) and the 2-bit
+  # digits of the genome (4 for characters outside the alphabet), the
+  # function returns the number of approximate occurrences of every
+  # pattern. The bit vectors of all the patterns are numpy uint64 arrays
+  # updated together, one character of the genome at a time; bits above
+  # the pattern length never flow back into the lower ones, so they are
+  # simply ignored.
+
+    last_bit = numpy.uint64(1 << (pattern_length - 1))
+    one, zero = numpy.uint64(1), numpy.uint64(0)
+    matches = numpy.zeros((5, len(pattern_codes)), dtype=numpy.uint64)  # row 4 never matches
+    for position in range(pattern_length):
+        pattern_digits = (pattern_codes >> numpy.uint64(2 * (pattern_length - 1 - position))) & numpy.uint64(3)
+        for digit in range(4):
+            matches[digit] |= (pattern_digits == digit).astype(numpy.uint64) << numpy.uint64(position)
+    plus_vertical = numpy.full(len(pattern_codes), numpy.uint64((1 << pattern_length) - 1))
+    minus_vertical = numpy.zeros(len(pattern_codes), dtype=numpy.uint64)
+    score = numpy.full(len(pattern_codes), pattern_length, dtype=numpy.int64)
+    approximate_occurrences = numpy.zeros(len(pattern_codes), dtype=numpy.int64)
+    for digit in digits.tolist():
+        equal = matches[digit]
+        vertical = equal | minus_vertical
+        horizontal = (((equal & plus_vertical) + plus_vertical) ^ plus_vertical) | equal
+        plus_horizontal = minus_vertical | ~(horizontal | plus_vertical)
+        minus_horizontal = plus_vertical & horizontal
+        score += (plus_horizontal & last_bit != zero)
+        score -= (minus_horizontal & last_bit != zero)
+        plus_horizontal <<= one
+        minus_horizontal <<= one
+        plus_vertical = minus_horizontal | ~(vertical | plus_horizontal)
+        minus_vertical = plus_horizontal & vertical
+        approximate_occurrences += score <= maximum_distance
+    return approximate_occurrences
+
+def edit_distance_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet, batch_size=1 << 16):
+
+  # Same as find_recurrent_pattern with the edit distance: all the
+  # patterns are still tried, but batch_size of them at a time share a
+  # single pass over the genome (see edit_distance_counts).
+
+    if isinstance(genome, PackedGenome):
+        records = [genome.digits(start, stop) for start, stop in genome.records()]  # matched one by one
+    else:
+        table = numpy.full(256, 4, dtype=numpy.uint8)
+        for digit, character in enumerate(alphabet):
+            table[ord(character)] = digit
+        records = [table[numpy.frombuffer(genome.encode('ascii'), dtype=numpy.uint8)]]
+    best_number_of_occurrences, best_code = 0, None
+    for start in range(0, 1 << 2 * pattern_length, batch_size):
+        pattern_codes = numpy.arange(start, min(start + batch_size, 1 << 2 * pattern_length), dtype=numpy.uint64)
+        counts = sum(edit_distance_counts(pattern_codes, pattern_length, digits, maximum_distance) for digits in records)
+        best = int(numpy.argmax(counts))
+        if counts[best] > best_number_of_occurrences:
+            best_number_of_occurrences, best_code = int(counts[best]), start + best
+    if best_code is None: raise ValueError  # no occurrence at all, as in find_recurrent_pattern
+    return decode_pattern(best_code, pattern_length, alphabet)
+
+def find_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet, engine='brute_force', workers=None, strategy='prefix', distance='hamming'):
 
   # Given the pattern length, the genome string, the maximum Hamming
   # distance allowed and the alphabet from which the genome string is 
@@ -109,17 +778,50 @@ def find_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet):
   # frequent patterns and as values the number of times that the pattern 
   # is present in the genome string, and then selecting the key 
   # corresponding to the higher value.
+  # The engine can be 'brute_force' (the default, described above),
+  # 'neighborhood' (see neighborhood_recurrent_pattern),
+  # 'branch_and_bound' (see branch_and_bound_recurrent_pattern) or
+  # 'parallel' (see parallel_recurrent_pattern, which takes workers and
+  # strategy). With distance='edit' the occurrences allow insertions and
+  # deletions as well (see count_approximate_occurrences); only the
+  # brute force engine supports it, for patterns of at most 32
+  # characters (see edit_distance_recurrent_pattern).
+
+    if distance == 'edit':
+        if engine != 'brute_force' or pattern_length > 32: raise ValueError
+        return edit_distance_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet)
+    if distance != 'hamming': raise ValueError
+    if engine == 'neighborhood':
+        return neighborhood_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet)
+    if engine == 'branch_and_bound':
+        return branch_and_bound_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet)
+    if engine == 'parallel':
+        return parallel_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet, workers, strategy)
+    if engine != 'brute_force': raise ValueError
+    if isinstance(genome, str) and pattern_length <= 32:
+      # The genome is packed once, so that its k-mer codes are shared by all
+      # the patterns (strings with other characters are left as they are).
+        try:
+            with timed_phase('packing'):
+                genome = PackedGenome.from_string(genome, alphabet)
+        except ValueError:
+            pass
 
     dictionary_of_recurrent_patterns = dict()  # initialization of the dictionary
     best_number_of_occurrences = 0  # initialization of the numerical variable that will store the highest number of approximate occurrences
+    number_of_patterns = len(alphabet) ** pattern_length  # only used to report the progress
+
+    with timed_phase('search'):
+        for done, pattern in enumerate(patterns_generator(pattern_length, alphabet), 1):
+            number_of_approximate_occurrences = count_approximate_occurrences(pattern, genome, maximum_distance, alphabet)
+            if monitor is not None:
+                monitor.count('patterns_evaluated')
+                monitor.progress(done, number_of_patterns, 'find_recurrent_pattern')
 
-    for pattern in patterns_generator(pattern_length, alphabet):
-        number_of_approximate_occurrences = count_approximate_occurrences(pattern, genome, maximum_distance)
-        
-        if number_of_approximate_occurrences > best_number_of_occurrences:
-            dictionary_of_recurrent_patterns[pattern] = number_of_approximate_occurrences
-          # Updates the highest number of occurrences whenever the condition (of the if statement) is satisfied.
-            best_number_of_occurrences = number_of_approximate_occurrences
+            if number_of_approximate_occurrences > best_number_of_occurrences:
+                dictionary_of_recurrent_patterns[pattern] = number_of_approximate_occurrences
+              # Updates the highest number of occurrences whenever the condition (of the if statement) is satisfied.
+                best_number_of_occurrences = number_of_approximate_occurrences
 
   # Gets the key (of dictionary_of_recurrent_patterns) corresponding to the maximum value, i.e. number_of_approximate_occurrences.
     mostly_repeated_pattern = max(dictionary_of_recurrent_patterns, key=dictionary_of_recurrent_patterns.get)
@@ -130,6 +832,118 @@ def find_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet):
     return mostly_repeated_pattern
 
 
+def cached_k_mer_histogram(genome, pattern_length, cache_dir=None):
+
+  # Same output of k_mer_histogram, but when a cache_dir is given the
+  # histogram is stored there as a .npy file named after the fingerprint
+  # of the genome and the pattern length, and later calls (with any
+  # maximum distance or number of patterns) memory-map it read-only
+  # instead of scanning the genome again. The file is written under a
+  # temporary name and then renamed, so that a half-written table is
+  # never loaded.
+
+    if cache_dir is None: return k_mer_histogram(genome, pattern_length)
+    file_name = os.path.join(cache_dir, f'{genome.fingerprint()}_{pattern_length}.npy')
+    if not os.path.exists(file_name):
+        os.makedirs(cache_dir, exist_ok=True)
+        temporary_file_name = f'{file_name}.{os.getpid()}.tmp'
+        with open(temporary_file_name, 'wb') as file:
+            numpy.save(file, k_mer_histogram(genome, pattern_length))
+        os.replace(temporary_file_name, file_name)
+    return numpy.load(file_name, mmap_mode='r')
+
+def top_recurrent_patterns(pattern_length, genome, maximum_distance, alphabet, k=1, positions=False, cache_dir=None):
+
+  # Given the same input of find_recurrent_pattern, the function returns
+  # the k patterns with the most approximate occurrences (fewer if not
+  # enough patterns occur at all) as a list of (pattern, count) pairs,
+  # from the most frequent one and, for equal counts, in the order of
+  # patterns_generator, so that the first pair holds the pattern returned
+  # by find_recurrent_pattern. With positions=True every pair becomes a
+  # triple with the numpy array of the starting positions of the k-mers
+  # within maximum_distance from the pattern. The counts come from the
+  # k-mer histogram (see cached_k_mer_histogram) spread as in
+  # neighborhood_recurrent_pattern.
+
+    if k <= 0: return []
+    if isinstance(genome, str): genome = PackedGenome.from_string(genome, alphabet)
+    histogram = cached_k_mer_histogram(genome, pattern_length, cache_dir)
+    counts = neighborhood_counts(histogram, pattern_length, maximum_distance)
+    candidates = numpy.flatnonzero(counts)
+    if k < len(candidates):
+      # Keeps every pattern tied with the k-th count, then sorts them all.
+        threshold = numpy.partition(counts[candidates], len(candidates) - k)[len(candidates) - k]
+        candidates = candidates[counts[candidates] >= threshold]
+    candidates = candidates[numpy.lexsort((candidates, -counts[candidates]))][:k]
+
+    top_patterns = []
+    for code in candidates.tolist():
+        pattern = decode_pattern(code, pattern_length, alphabet)
+        if positions:
+            matches = numpy.flatnonzero((hamming_distances(code, genome.k_mer_codes(pattern_length)) <= maximum_distance) & genome.k_mer_mask(pattern_length))
+            top_patterns.append((pattern, int(counts[code]), matches))
+        else:
+            top_patterns.append((pattern, int(counts[code])))
+    return top_patterns
+
+class IncrementalMotifCounter:
+
+  # Keeps the approximate occurrences of every pattern of a given length
+  # (with the meaning of count_approximate_occurrences) in a genome that
+  # grows over time: each appended chunk only adds the k-mers ending in
+  # it, including the ones starting in the last pattern_length - 1
+  # nucleotides already seen, which are kept aside. Counts can only grow,
+  # so the most frequent pattern changes only towards one of the patterns
+  # touched by the new k-mers, and it is kept up to date in the same pass:
+  # an update costs the new nucleotides times the size of a neighborhood,
+  # and a query is answered in constant time.
+
+    def __init__(self, pattern_length, maximum_distance, alphabet=genomic_alphabet):
+        if pattern_length > 32: raise ValueError
+        self.pattern_length = pattern_length
+        self.maximum_distance = maximum_distance
+        self.alphabet = alphabet
+        self.masks = numpy.array(neighborhood_masks(pattern_length, maximum_distance), dtype=numpy.uint64)
+        self.counts = numpy.zeros(1 << 2 * pattern_length, dtype=numpy.int64)
+        self.tail = numpy.zeros(0, dtype=numpy.uint8)
+        self.length = 0
+        self.best_code, self.best_number_of_occurrences = None, 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, chunk):
+
+      # Adds a chunk of the genome (a string over the alphabet, otherwise
+      # ValueError is raised as in genome_digits).
+
+        digits = numpy.concatenate((self.tail, genome_digits(chunk, self.alphabet)))
+        self.length += len(chunk)
+        self.tail = digits[max(len(digits) - self.pattern_length + 1, 0):] if self.pattern_length > 1 else digits[:0]
+        if len(digits) < self.pattern_length: return
+        k_mers, occurrences = numpy.unique(k_mer_codes(digits, self.pattern_length), return_counts=True)
+        for mask in self.masks:
+            patterns = k_mers ^ mask
+            self.counts[patterns] += occurrences
+            pattern_counts = self.counts[patterns]
+            highest = int(pattern_counts.max())
+            if highest >= self.best_number_of_occurrences:
+                code = int(patterns[pattern_counts == highest].min())
+                if highest > self.best_number_of_occurrences or code < self.best_code:
+                    self.best_code, self.best_number_of_occurrences = code, highest
+
+    def count(self, pattern):
+        return int(self.counts[encode_pattern(pattern, self.alphabet)])
+
+    def most_frequent_pattern(self):
+
+      # The first pattern (in the order of patterns_generator) with the
+      # highest count, as find_recurrent_pattern returns for the genome
+      # appended so far; ValueError if it holds no k-mer yet.
+
+        if self.best_code is None: raise ValueError
+        return decode_pattern(self.best_code, self.pattern_length, self.alphabet)
+
 """         ------------------------------------------------------         """
 # The following section of the code makes it more user-friendly executable,
 # since it allows to run the code entirely from the command line by typing
@@ -139,11 +953,11 @@ def find_recurrent_pattern(pattern_length, genome, maximum_distance, alphabet):
 
 if __name__ == '__main__':
 
-    if len(sys.argv) != 2:
-        pattern_length, maximum_distance, genome = read_instance('inputdata.txt', genomic_alphabet)
-    else:
-        inputdata = str(sys.argv[1])
-        pattern_length, maximum_distance, genome = read_instance(inputdata, genomic_alphabet)
+    # A FASTA file can be used as well, giving the pattern length and the
+    # maximum distance after its name: $ python3 third.py genome.fa 10 2
+    inputdata = str(sys.argv[1]) if len(sys.argv) > 1 else 'inputdata.txt'
+    parameters = [int(argument) for argument in sys.argv[2:4]]
+    pattern_length, maximum_distance, genome = read_packed_instance(inputdata, genomic_alphabet, *parameters)
     print(find_recurrent_pattern(pattern_length, genome, maximum_distance, genomic_alphabet))
 
 """There follow some additional tests I have made: